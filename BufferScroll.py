@@ -2,214 +2,2778 @@ import sublime, sublime_plugin
 from os.path import lexists, normpath, dirname
 from os import makedirs, remove, rename
 from hashlib import sha1
-from gzip import GzipFile
-from collections import OrderedDict
-import _thread as thread
+from collections import OrderedDict, Counter
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, islice
+from operator import sub
 import threading
 
 try:
-    from cPickle import load, dump
+    from cPickle import loads, dumps, Unpickler
 except:
-    from pickle import load, dump
+    from pickle import loads, dumps, Unpickler
 
 import os
+import mmap
+import zlib
+import struct
 import sys
 import time
+import math
+import json
+import functools
+import tempfile
 from os.path import basename
+from types import MappingProxyType
 
 
-# Import the debugger
-from debug_tools import getLogger
+# Enable debug messages: (bitwise)
+#
+# 0   - Disabled debugging.
+# 1   - Basic logging messages.
+# 2   - Original levels from tito
+#
+# Debugger settings: 0 - disabled, 127 - enabled
+def log(*args):
+    """
+        The debugger is only imported by the first message, so it does not slow down the startup.
+    """
+    global log
+
+    from debug_tools import getLogger
+    log = getLogger( 127, __name__ )
+    log( *args )
+
+#log.setup( "Debug.txt" )
+#log.clear()
+
+# log( 1, "Debugging" )
+# log( 1, "..." )
+# log( 1, "..." )
+
+# import inspect
+database = ""
+preferences = None
+BufferScrollAPI = None
+clone_registry = None
+
+data_base = None
+database_loaded = False
+pending_until_loaded = []
+
+# guards `database_loaded` and `pending_until_loaded`, the views events come from two threads
+pending_lock = threading.RLock()
+startup_timings = OrderedDict()
+profiler = None
+save_thread = None
+g_settings = None
+already_restored = {}
+scroll_already_restored = {}
+
+focused_view_id = -1
+focused_view = None
+
+synch_scroll_armed = False
+
+# when the current view last moved, or 0 once it lost the focus
+synch_scroll_idle_since = 0
+synch_scroll_last_view_id = 0
+synch_scroll_last_view_position = 0
+synch_data_pending = {}
+
+# the hash of the bookmarks, marks or folds last synched, and the views having them, by buffer
+# id and kind
+region_versions = {}
+
+# the views scrolling together through a line alignment, by view id
+scroll_links = {}
+
+# the typewriter scrolling waits the next frame, and remembers the row it centered
+typewriter_armed = False
+typewriter_last = None
+
+# background tabs waiting to be restored, by view id
+restore_queue = OrderedDict()
+restore_idle_armed = False
+
+# the record id of each file path, and the path each view had when its id was last asked
+path_ids = {}
+view_paths = {}
+
+# what `save` last read from each view
+save_change_counts = {}
+regions_dirty = set()
+
+# the text commands which change the regions synched across clones
+synch_data_commands = {
+    'fold': ('folds',),
+    'fold_all': ('folds',),
+    'fold_by_level': ('folds',),
+    'fold_tag_attributes': ('folds',),
+    'unfold': ('folds',),
+    'unfold_all': ('folds',),
+    'toggle_bookmark': ('bookmarks',),
+    'clear_bookmarks': ('bookmarks',),
+    'set_mark': ('marks',),
+    'swap_with_mark': ('marks',),
+    'select_to_mark': ('marks',),
+    'delete_to_mark': ('marks',),
+}
+
+last_focused_view_name = ''
+disable_scroll_restoring = False
+g_isToAllowSelectOperationOnTheClonedView = False
+
+
+def plugin_loaded():
+    global database, preferences, BufferScrollAPI, data_base, g_settings, save_thread, clone_registry
+    global database_loaded, profiler
+
+    start = time.time()
+    startup_timings.clear()
+    database_loaded = False
+
+    # open
+    database = dirname(sublime.packages_path())+'/Settings/BufferScroll.bin'
+
+    try:
+        makedirs(dirname(database))
+
+    except:
+        pass
+
+    # settings
+    g_settings = sublime.load_settings('BufferScroll.sublime-settings')
+    profiler = BufferScrollProfiler()
+    preferences = Preferences()
+    preferences.load()
+
+    # only the indexes are read, the records are read when their views are opened
+    data_base = open_database(dirname(database))
+    BufferScrollLoadThread(start).start()
+
+    g_settings.clear_on_change('BufferScroll')
+    g_settings.add_on_change('BufferScroll', lambda:preferences.load())
+
+    BufferScrollAPI = BufferScroll()
+
+    clone_registry = BufferScrollCloneRegistry()
+    clone_registry.scan()
+
+    save_thread = BufferScrollSaveThread()
+    save_thread.start()
+
+    startup_timings['plugin_loaded'] = time.time()-start
+
+
+def open_database(folder):
+    """
+        Returns the database of the `database_backend` setting. Not every Sublime Text build
+        bundles the sqlite3 module, then the database file is used.
+    """
+
+    if preferences.database_backend == 'sqlite':
+
+        # only probed, as in `compression_available`, `connect` imports it
+        try:
+            __import__('sqlite3')
+            return BufferScrollSqliteDatabase(folder+'/BufferScroll.sqlite')
+
+        except ImportError:
+            print('BufferScroll: the sqlite3 module is not available, using the database file')
+
+    return BufferScrollDatabase(folder+'/BufferScroll.bin')
+
+
+def when_loaded(callback):
+    """
+        Returns False when the database is still loading, after queuing the callback to be run,
+        in order, once it finishes.
+    """
+
+    with pending_lock:
+
+        if database_loaded:
+            return True
+
+        pending_until_loaded.append(callback)
+        return False
+
+
+def database_ready(start):
+    """
+        Runs the queued callbacks with the lock held, so the other thread waits for them before
+        running its own, and the main thread can queue more meanwhile.
+    """
+    global database_loaded
+
+    with pending_lock:
+        database_loaded = True
+        startup_timings['ready'] = time.time()-start
+
+        queued = time.time()
+        startup_timings['queued_calls'] = len(pending_until_loaded)
+
+        while pending_until_loaded:
+            pending_until_loaded.pop(0)()
+
+        startup_timings['queued_calls_time'] = time.time()-queued
+
+
+class BufferScrollLoadThread(threading.Thread):
+    """
+        Loads the database out of the plugin host startup, then restores the views opened meanwhile.
+    """
+
+    def __init__(self, start):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.start_time = start
+
+    def run(self):
+        global data_base
+
+        startup_timings['load_thread_wait'] = time.time()-self.start_time
+
+        try:
+
+            with profiler.timed('load'):
+                data_base.load(dirname(database)+'/BufferScroll.bin.gz')
+
+            startup_timings.update(data_base.timings)
+
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+            # the files are kept as they are, and this session records go to an empty database
+            folder = tempfile.mkdtemp(prefix = 'BufferScroll')
+            print('BufferScroll: could not load the database, using an empty one in %s until restart' % folder)
+
+            data_base = BufferScrollDatabase(folder+'/BufferScroll.bin')
+            data_base.load()
+
+        finally:
+            sublime.set_timeout(lambda: database_ready(self.start_time), 0)
+
+
+def plugin_unloaded():
+    g_settings.clear_on_change('BufferScroll')
+
+    if save_thread:
+        save_thread.stop()
+
+        if database_loaded:
+            save_thread.flush()
+
+    if data_base:
+        data_base.close()
+
+
+def is_cloned_view( target_view ):
+    window_id = sublime.active_window().id()
+
+    for view in clone_registry.siblings( target_view ):
+        window = view.window()
+
+        if window and window.id() == window_id:
+            # log( 1, "( fix_project_switch_restart_bug.py ) Is a cloned view: True" )
+            return True
+
+    return False
+
+
+class BufferScrollCloneRegistry():
+    """
+        The views of each buffer, so the clones of a view are found without looking at every view
+        of every window.
+
+        It is kept from the view events, and as the application does not send all of them, like
+        when switching projects, views without a window are dropped when found. With the
+        `clone_registry_self_check` setting, every lookup is compared with a full scan, and any
+        difference is printed to the console and fixed.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+        self.views = {}
+        self.indexes = {}
+        self.plans = {}
+
+    def scan(self):
+        self.buffers = {}
+        self.views = {}
+        self.indexes = {}
+        self.plans = {}
+
+        for window in sublime.windows():
+
+            for view in window.views():
+                self.add(view)
+
+    def add(self, view):
+        view_id = view.id()
+        buffer_id = view.buffer_id()
+
+        if self.views.get(view_id) == buffer_id:
+            return
+
+        self.plans.pop(self.views.get(view_id), None)
+        self.plans.pop(buffer_id, None)
+
+        self.views[view_id] = buffer_id
+        self.buffers.setdefault(buffer_id, OrderedDict())[view_id] = view
+
+    def remove(self, view):
+        view_id = view.id()
+        buffer_id = self.views.pop(view_id, None)
+        self.indexes.pop(view_id, None)
+        self.plans.pop(buffer_id, None)
+
+        if buffer_id in self.buffers:
+            self.buffers[buffer_id].pop(view_id, None)
+
+            if not self.buffers[buffer_id]:
+                del self.buffers[buffer_id]
+
+    def siblings(self, view):
+        """
+            The other views of the view buffer.
+        """
+        self.add(view)
+
+        if preferences.clone_registry_self_check:
+            self.check()
+
+        view_id = view.id()
+        siblings = []
+
+        for _view_id, _view in list(self.buffers[self.views[view_id]].items()):
+
+            if _view_id == view_id:
+                continue
+
+            if _view.window() is None:
+                self.remove(_view)
+
+            else:
+                siblings.append(_view)
+
+        return siblings
+
+    def index(self, view):
+        """
+            The window and position of the view, cached until it is activated, closed, or its
+            window runs a command, which may move it.
+        """
+        view_id = view.id()
+
+        if view_id not in self.indexes:
+            window = view.window();
+
+            if not window:
+                window = sublime.active_window()
+
+            self.indexes[view_id] = str(window.id())+str(window.get_view_index(view))
+
+        return self.indexes[view_id]
+
+    def plan(self, view, extent):
+        """
+            The synch scroll plan of the view buffer, or None when it has no clones which are not
+            loading.
+
+            It is cached until a view of the buffer is added, removed, activated or moved by a
+            window command, as a layout change, or the view `extent` changes, as on a resize.
+        """
+        plan = self.plans.get(self.views.get(view.id()))
+
+        if plan is None or not plan.complete or plan.extents.get(view.id()) != extent:
+            plan = BufferScrollSynchPlan(view, self.siblings(view), extent)
+            self.plans[self.views[view.id()]] = plan
+
+        if len(plan.views) < 2:
+            return None
+
+        return plan
+
+    def invalidate(self, view = None, window = None):
+
+        if view is not None:
+            self.indexes.pop(view.id(), None)
+            self.plans.pop(self.views.get(view.id()), None)
+
+        if window is not None:
+
+            for _view in window.views():
+                self.indexes.pop(_view.id(), None)
+                self.plans.pop(self.views.get(_view.id()), None)
+
+    def check(self):
+        expected = {}
+
+        for window in sublime.windows():
+
+            for view in window.views():
+                expected[view.id()] = view.buffer_id()
+
+        known = dict((view_id, buffer_id) for view_id, buffer_id in self.views.items()
+                if self.buffers[buffer_id][view_id].window() is not None)
+
+        if known != expected:
+            missing = set(expected) - set(known)
+            stale = set(known) - set(expected)
+
+            print('BufferScroll: the clone registry drifted, missing views %s, stale views %s, '
+                    'other buffers %s' % (sorted(missing), sorted(stale),
+                    sorted(view_id for view_id in set(known) & set(expected)
+                    if known[view_id] != expected[view_id])))
+
+            self.scan()
+
+
+class BufferScrollSynchPlan():
+    """
+        The clones of a buffer in the order of their windows and groups, with their viewport
+        extent and line height, and the point each clone was last scrolled to.
+    """
+
+    def __init__(self, view, siblings, extent):
+        self.complete = True
+        self.extents = {view.id(): extent}
+        self.heights = {view.id(): view.line_height()}
+        self.targets = {}
+
+        views = [view]
+
+        for _view in siblings:
+
+            if _view.is_loading():
+                self.complete = False
+
+            else:
+                views.append(_view)
+                self.extents[_view.id()] = _view.viewport_extent()
+                self.heights[_view.id()] = _view.line_height()
+
+        views.sort(key = clone_registry.index)
+        self.views = views
+
+    def moved(self, view, target, change_count):
+        """
+            Whether the `target` point of the view is not the one of the last call, for the same
+            text.
+        """
+        target = (target, change_count)
+
+        if self.targets.get(view.id()) == target:
+            return False
+
+        self.targets[view.id()] = target
+        return True
+
+
+def aligned_blocks(a, b):
+    """
+        The blocks of equal lines of the lists `a` and `b`, as (a start, b start, length) tuples in
+        order.
+
+        As on the patience diff, the lines found only once on each side are matched by their
+        longest increasing sequence, then each match grows to the equal lines around it. It takes
+        O(n log n) time, against the quadratic worst case of `difflib`, which takes seconds on
+        files with 100k lines.
+    """
+    counts_a = Counter(a)
+    counts_b = Counter(b)
+
+    unique = dict((line, j) for j, line in enumerate(b) if counts_b[line] == 1 and counts_a[line] == 1)
+    pairs = [(i, unique[line]) for i, line in enumerate(a) if line in unique]
+
+    # the longest increasing sequence of the b lines
+    tails = []
+    indexes = []
+    previous = []
+
+    for n, (i, j) in enumerate(pairs):
+        k = bisect_left(tails, j)
+
+        if k == len(tails):
+            tails.append(j)
+            indexes.append(n)
+
+        else:
+            tails[k] = j
+            indexes[k] = n
+
+        previous.append(indexes[k-1] if k else -1)
+
+    anchors = []
+    n = indexes[-1] if indexes else -1
+
+    while n != -1:
+        anchors.append(pairs[n])
+        n = previous[n]
+
+    anchors.reverse()
+
+    blocks = []
+    end_a = end_b = 0
+
+    for i, j in anchors:
+
+        # already inside the last block
+        if i < end_a or j < end_b:
+            continue
+
+        start_a, start_b = i, j
+
+        while start_a > end_a and start_b > end_b and a[start_a-1] == b[start_b-1]:
+            start_a -= 1
+            start_b -= 1
+
+        end_a, end_b = i+1, j+1
+
+        while end_a < len(a) and end_b < len(b) and a[end_a] == b[end_b]:
+            end_a += 1
+            end_b += 1
+
+        blocks.append((start_a, start_b, end_a-start_a))
+
+    return blocks
+
+def alignment_table(blocks, lines_a, lines_b):
+    """
+        The first lines of the blocks on each side, their lengths, and the line counts.
+    """
+    return (([block[0] for block in blocks], [block[1] for block in blocks]), [block[2] for block in blocks],
+            [lines_a, lines_b])
+
+def aligned_line(table, side, line):
+    """
+        The line of the other side aligned with the line of the `side`, 0 or 1.
+    """
+    starts, sizes, lines = table
+
+    own = starts[side]
+    other = starts[1-side]
+    k = bisect_right(own, line)-1
+
+    if k >= 0 and line < own[k]+sizes[k]:
+        return other[k]+line-own[k]
+
+    # between the blocks k and k+1
+    from_start = own[k]+sizes[k] if k >= 0 else 0
+    to_start = other[k]+sizes[k] if k >= 0 else 0
+    from_end = own[k+1] if k+1 < len(own) else lines[side]
+    to_end = other[k+1] if k+1 < len(other) else lines[1-side]
+
+    return to_start+(line-from_start)*(to_end-to_start)//max(1, from_end-from_start)
+
+
+class BufferScrollAlignment():
+    """
+        Two views of different files scrolling together, as two revisions of a file side by side.
+
+        Their lines are mapped through the blocks of equal lines found by `aligned_blocks`, kept as
+        the sorted first lines of the blocks on each view, so a line is mapped by a binary search.
+        The lines between two blocks are mapped proportionally.
+
+        An edit which adds or removes lines shifts the blocks after the line of the first
+        selection. After any edit, the text is diffed again, in the background, once the edits
+        stopped for a second, as the edit may have been elsewhere, or changed lines in place.
+    """
+
+    def __init__(self, a, b):
+        self.views = (a, b)
+        self.version = 0
+        self.last = None
+        self.last_table = None
+
+        self.table = alignment_table([], self.line_count(a), self.line_count(b))
+
+    def line_count(self, view):
+        return view.rowcol(view.size())[0]+1
+
+    def other(self, view):
+        return self.views[1] if view.id() == self.views[0].id() else self.views[0]
+
+    def side(self, view):
+        return 0 if view.id() == self.views[0].id() else 1
+
+    def compute(self):
+        version = self.version
+        texts = [view.substr(sublime.Region(0, view.size())).split('\n') for view in self.views]
+
+        def diff():
+            blocks = aligned_blocks(*texts)
+
+            if version == self.version:
+                self.table = alignment_table(blocks, len(texts[0]), len(texts[1]))
+
+        sublime.set_timeout_async(diff, 0)
+
+    def map(self, view, line):
+        """
+            The line of the other view aligned with the line of the view.
+        """
+        return aligned_line(self.table, self.side(view), line)
+
+    def edited(self, view):
+        self.version += 1
+        version = self.version
+
+        starts, sizes, lines = self.table
+        side = self.side(view)
+
+        count = self.line_count(view)
+        delta = count-lines[side]
+
+        if delta:
+            self.table = self.shifted(view, side, delta)
+
+        # the lines may have changed in place too
+        def compute():
+
+            if version == self.version and self.views[0].is_valid() and self.views[1].is_valid():
+                self.compute()
+
+        sublime.set_timeout(compute, 1000)
+
+    def shifted(self, view, side, delta):
+        """
+            The table after `delta` lines were added or removed after the line of the first
+            selection, the last line edited.
+        """
+        starts, sizes, lines = self.table
+
+        own = list(starts[side])
+        other = list(starts[1-side])
+        sizes = list(sizes)
+        lines = list(lines)
+        lines[side] += delta
+
+        # the first line after the edited one, and the first removed line, before the edit
+        split = 0
+
+        if len(view.sel()):
+            row, col = view.rowcol(view.sel()[0].b)
+
+            # as after pasting or deleting whole lines, the line of a caret at its start moved
+            split = max(0, row+(1 if col else 0)-delta)
+
+        removed = split+delta if delta < 0 else split
+
+        for cut in sorted(set((removed, split))):
+            k = bisect_right(own, cut)-1
+
+            if k >= 0 and own[k] < cut < own[k]+sizes[k]:
+                head = cut-own[k]
+                own.insert(k+1, cut)
+                other.insert(k+1, other[k]+head)
+                sizes.insert(k+1, sizes[k]-head)
+                sizes[k] = head
+
+        # the blocks of the removed lines go, and the ones after them move
+        first = bisect_left(own, removed)
+        last = bisect_left(own, split)
+
+        del own[first:last], other[first:last], sizes[first:last]
+
+        for k in range(first, len(own)):
+            own[k] += delta
+
+        starts = [None, None]
+        starts[side] = own
+        starts[1-side] = other
+        return (tuple(starts), sizes, lines)
+
+    def synch(self, view):
+        """
+            Scrolls the other view to the lines aligned with the view.
+        """
+        other = self.other(view)
+
+        if other.window() is None or other.is_loading():
+            return None
+
+        position = view.viewport_position()
+        line = view.rowcol(view.visible_region().a)[0]
+        target = self.map(view, line)
+
+        last = (view.id(), target)
+
+        if self.last == last and self.last_table is self.table:
+            return True
+
+        self.last = last
+        self.last_table = self.table
+
+        # keeps how much of the first line is above the viewport
+        offset = position[1]-view.text_to_layout(view.text_point(line, 0))[1]
+        top = other.text_to_layout(other.text_point(target, 0))[1]+offset
+        left, old_top = other.viewport_position()
+
+        if abs(old_top-top) >= other.line_height():
+            other.set_viewport_position((left, top), preferences.use_animations)
+
+        return True
+
+
+def link_views(a, b):
+    alignment = BufferScrollAlignment(a, b)
+
+    unlink_view(a)
+    unlink_view(b)
+
+    scroll_links[a.id()] = alignment
+    scroll_links[b.id()] = alignment
+    alignment.compute()
+
+def unlink_view(view):
+    alignment = scroll_links.pop(view.id(), None)
+
+    if alignment is not None:
+        scroll_links.pop(alignment.other(view).id(), None)
+
+    return alignment
+
+
+class Preferences():
+
+    # the settings, and their values when not set
+    defaults = (
+        ('remember_color_scheme',                       False),
+        ('remember_syntax',                             False),
+        ('synch_bookmarks',                             False),
+        ('synch_marks',                                 False),
+        ('synch_folds',                                 False),
+        ('synch_scroll',                                False),
+        ('typewriter_scrolling',                        False),
+        ('typewriter_scrolling_shift',                  0),
+        ('typewriter_scrolling_follow_cursor_movement', True),
+        ('synch_scroll_idle_timeout',                   1500),
+        ('synch_scroll_idle_interval',                  500),
+        ('synch_scroll_idle_limit',                     60000),
+        ('use_animations',                              False),
+        ('clone_registry_self_check',                   False),
+        ('i_use_cloned_views',                          False),
+        ('database_backend',                            'file'),
+        ('database_compression',                        'zlib'),
+        ('database_compression_level',                  6),
+        ('max_database_records',                        500),
+        ('max_database_size',                           4194304),
+        ('max_database_age',                            365),
+        ('max_cached_records',                          100),
+        ('journal_compact_size',                        1048576),
+        ('journal_compact_ratio',                       4),
+        ('save_debounce_delay',                         1000),
+        ('save_max_latency',                            5000),
+        ('lazy_restore_budget',                         10),
+        ('lazy_restore_interval',                       50),
+        ('profiling',                                   False),
+        ('restore_scroll',                              True),
+        ('remember_settings_list',                      []),
+    )
+
+    @classmethod
+    def load(cls):
+        table = {}
+
+        for name, default in cls.defaults:
+            table[name] = g_settings.get(name, default)
+
+        table['typewriter_scrolling_shift'] = int(table['typewriter_scrolling_shift'])
+        table['database_compression'] = compression_available(table['database_compression'])
+
+        for name, value in table.items():
+            setattr(cls, name, value)
+
+        # the resolved settings of each syntax, and of each view, built as they are asked for
+        cls.table = MappingProxyType(table)
+        cls.syntax_tables = {}
+        cls.view_tables = {}
+
+        profiler.install(BufferScroll, cls.profiling)
+
+    # syntax specific settings
+    @classmethod
+    def get(cls, type, view):
+        view_id = view.id()
+
+        if view_id in cls.view_tables:
+            return cls.view_tables[view_id][type]
+
+        syntax = view.settings().get('syntax')
+        syntax = basename(syntax).split('.')[0].lower() if syntax != None else "plain text"
+
+        # log( 1, "preferences: " + syntax )
+        cls.view_tables[view_id] = cls.syntax_table(syntax)
+        return cls.view_tables[view_id][type]
+
+    @classmethod
+    def syntax_table(cls, syntax):
+
+        if syntax not in cls.syntax_tables:
+            specific = g_settings.get(syntax)
+
+            if isinstance(specific, dict) and specific:
+                table = dict(cls.table)
+                table.update(specific)
+                cls.syntax_tables[syntax] = MappingProxyType(table)
+
+            else:
+                cls.syntax_tables[syntax] = cls.table
+
+        return cls.syntax_tables[syntax]
+
+    @classmethod
+    def forget(cls, view):
+        """
+            Resolves the settings of the view again, the next time, as its syntax changed.
+        """
+        cls.view_tables.pop(view.id(), None)
+
+
+class BufferScrollHistogram():
+    """
+        Counts the durations in a fixed number of buckets, four for each power of two microseconds,
+        so the percentiles are within 19% of the real ones, whatever the number of samples.
+    """
+
+    buckets_count = 128
+
+    def __init__(self):
+        self.buckets = [0] * self.buckets_count
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        microseconds = seconds * 1000000
+
+        if microseconds > 1:
+            self.buckets[min(int(math.log(microseconds, 2) * 4), self.buckets_count-1)] += 1
+
+        else:
+            self.buckets[0] += 1
+
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """
+            Returns the upper bound of the bucket with the percentile, in seconds.
+        """
+        wanted = fraction * self.count
+        seen = 0
+
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+
+            if count and seen >= wanted:
+                return min(2 ** ((bucket+1) / 4.0) / 1000000, self.max)
+
+        return self.max
+
+class BufferScrollProfiler():
+    """
+        Times the event handlers and the database operations, when the `profiling` setting is on.
+
+        When it is off, the handlers are not wrapped at all, and `timed` returns a shared context
+        manager which does nothing. The counters, as the bytes written, are always kept.
+    """
+
+    # besides the `on_*` event handlers
+    handlers = ('save', 'restore', 'restore_scrolling', 'synch_data', 'synch_scroll_tick', 'restore_idle_tick',
+            'typewriter_scroll')
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = Counter()
+        self.originals = {}
+        self.disabled = BufferScrollProfilerTimer(None, None)
+
+    def install(self, listener, enabled):
+        """
+            Wraps the methods of the event listener class with timers, or unwraps them.
+        """
+        self.enabled = enabled
+
+        if enabled and not self.originals:
+
+            for name in list(vars(listener)):
+
+                if name.startswith('on_') or name in self.handlers:
+                    self.originals[name] = getattr(listener, name)
+                    setattr(listener, name, self.wrap(name, self.originals[name]))
+
+        elif not enabled and self.originals:
+
+            for name, function in self.originals.items():
+                setattr(listener, name, function)
+
+            self.originals = {}
+
+    def wrap(self, name, function):
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                return function(*args, **kwargs)
+
+            finally:
+                self.add(name, time.perf_counter()-start)
+
+        return timed
+
+    def timed(self, name):
+        """
+            Returns a context manager timing its block as `name`.
+        """
+
+        if self.enabled:
+            return BufferScrollProfilerTimer(self, name)
+
+        return self.disabled
+
+    def add(self, name, seconds):
+
+        if name not in self.histograms:
+            self.histograms[name] = BufferScrollHistogram()
+
+        self.histograms[name].add(seconds)
+
+    def count(self, name, value = 1):
+        self.counters[name] += value
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = Counter()
+
+class BufferScrollProfilerTimer():
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+
+        if self.profiler:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+
+        if self.profiler:
+            self.profiler.add(self.name, time.perf_counter()-self.start)
+
+
+def region_array(regions):
+    """
+        Flattens the regions into an `array('q')` of `a, b` pairs.
+    """
+    return array('q', [point for region in regions for point in (region.a, region.b)])
+
+def region_list(points):
+    return [sublime.Region(points[i], points[i+1]) for i in range(0, len(points), 2)]
+
+def encode_regions(points):
+    """
+        Encodes an `array('q')` of `a, b` pairs, as runs of varints when the regions repeat, and
+        otherwise as the differences between the points, in the smallest array type fitting them.
+
+        In the runs, each region is stored as the distance from the previous region start, and its
+        length, both zigzag encoded, as marks or reversed selections are not always sorted, and
+        how many times it repeats, so a column of cursors over lines with the same length costs a
+        few bytes. Decoding the varints loops over the bytes, while the differences are decoded by
+        `array.frombytes` and a cumulative sum, so the runs are only used when there are few.
+    """
+
+    if not points:
+        return b''
+
+    runs = _encode_runs(points, max(1, len(points)//16))
+
+    if runs is not None:
+        return b'\0' + runs
+
+    return _encode_deltas(points)
+
+def _encode_runs(points, limit):
+    """
+        Returns the runs, or None when there are more than `limit` of them.
+    """
+    data = bytearray()
+    previous = 0
+    run = None
+    count = 0
+    runs = 0
+
+    for i in range(0, len(points), 2):
+        a = points[i]
+        region = (a-previous, points[i+1]-a)
+        previous = a
+
+        if region == run:
+            count += 1
+            continue
+
+        if count:
+            _encode_run(data, count, run)
+
+        runs += 1
+
+        if runs > limit:
+            return None
+
+        run = region
+        count = 1
+
+    if count:
+        _encode_run(data, count, run)
+
+    return bytes(data)
+
+def _encode_run(data, count, region):
+
+    for value in (count, region[0]*2 if region[0] >= 0 else -region[0]*2-1,
+            region[1]*2 if region[1] >= 0 else -region[1]*2-1):
+
+        while value > 127:
+            data.append(value & 127 | 128)
+            value >>= 7
+
+        data.append(value)
+
+def _encode_deltas(points):
+    """
+        The array typecode, the first point as a varint, then the differences between the points,
+        little-endian.
+    """
+    deltas = array('q', map(sub, islice(points, 1, None), points))
+    low = min(deltas) if deltas else 0
+    high = max(deltas) if deltas else 0
+
+    for typecode in 'bhiq':
+        bound = 1 << (array(typecode).itemsize*8-1)
+
+        if -bound <= low and high < bound:
+            break
+
+    deltas = array(typecode, deltas)
+
+    if sys.byteorder == 'big':
+        deltas.byteswap()
+
+    data = bytearray(typecode.encode('ascii'))
+    _append_varint(data, points[0])
+    data += deltas.tobytes()
+
+    return bytes(data)
+
+def decode_regions(data):
+
+    if not data:
+        return array('q')
+
+    if data[0]:
+        return _decode_deltas(data)
+
+    points = array('q')
+    fields = []
+    previous = 0
+    value = 0
+    shift = 0
+
+    for byte in islice(data, 1, None):
+        value |= (byte & 127) << shift
+
+        if byte & 128:
+            shift += 7
+            continue
+
+        fields.append(value)
+        value = 0
+        shift = 0
+
+        if len(fields) == 3:
+            count, start, length = fields
+            start = (start >> 1) ^ -(start & 1)
+            length = (length >> 1) ^ -(length & 1)
+            fields = []
+
+            for i in range(count):
+                previous += start
+                points.append(previous)
+                points.append(previous+length)
+
+    return points
+
+def _decode_deltas(data):
+    deltas = array(chr(data[0]))
+    first, position = _read_varint(data, 1)
+    deltas.frombytes(data[position:])
+
+    if sys.byteorder == 'big':
+        deltas.byteswap()
+
+    return array('q', accumulate(chain((first,), deltas)))
+
+def fingerprint(value):
+    """
+        A small value which changes when the value changes, for the regions, their count and the
+        hash of their bytes.
+    """
+
+    if isinstance(value, array):
+        return (len(value), hash(value.tobytes()))
+
+    return repr(value)
+
+class BufferScrollRecord():
+    """
+        What is remembered for a file.
+
+        The regions are kept flat in `array('q')`, as `a, b` pairs, instead of a list of two ints per
+        region. The old dictionary keys still work, `record['f']` returns the folds as a list of
+        `[a, b]` lists, and `to_dict()` and `from_dict()` convert from and to the old records.
+    """
+
+    fields = ('size', 'scroll', 'selections', 'marks', 'bookmarks', 'folds', 'previous_folds',
+            'color_scheme', 'syntax', 'settings', 'path')
+
+    # the fingerprints are not saved, they are computed again when needed
+    __slots__ = fields + ('fingerprints',)
+
+    keys = OrderedDict([('id', 'size'), ('l', 'scroll'), ('s', 'selections'), ('m', 'marks'),
+            ('b', 'bookmarks'), ('f', 'folds'), ('pf', 'previous_folds'), ('c', 'color_scheme'),
+            ('x', 'syntax'), ('p', 'settings')])
+
+    regions = ('selections', 'marks', 'bookmarks', 'folds', 'previous_folds')
+
+    # see `encode`
+    format = 1
+    position = struct.Struct('<dd')
+
+    def __init__(self):
+        self.size = 0
+        self.scroll = {}
+        self.selections = array('q')
+        self.marks = array('q')
+        self.bookmarks = array('q')
+        self.folds = array('q')
+        self.previous_folds = array('q')
+        self.color_scheme = None
+        self.syntax = None
+        self.settings = []
+        self.path = None
+        self.fingerprints = {}
+
+    def __getitem__(self, key):
+        name = self.keys[key]
+        value = getattr(self, name)
+
+        if name in self.regions:
+            return [[value[i], value[i+1]] for i in range(0, len(value), 2)]
+
+        if name == 'scroll':
+            return dict((index, list(position)) for index, position in value.items())
+
+        if name == 'settings':
+            return [{'k':item, 'v':setting} for item, setting in value]
+
+        return value
+
+    def __setitem__(self, key, value):
+        name = self.keys[key]
+
+        if name in self.regions:
+            value = array('q', [int(point) for region in value for point in region])
+
+        elif name == 'scroll':
+            value = dict((index, tuple(position)) for index, position in value.items())
+
+        elif name == 'settings':
+            value = [(item['k'], item['v']) for item in value if 'k' in item]
+
+        setattr(self, name, value)
+        self.fingerprints.pop(name, None)
+
+    def update(self, name, value):
+        """
+            Sets the field, returning whether its value changed. Only the fingerprints of the old
+            and new values are compared, see `fingerprint`.
+        """
+        new = fingerprint(value)
+
+        if name not in self.fingerprints:
+            self.fingerprints[name] = fingerprint(getattr(self, name))
+
+        if self.fingerprints[name] == new:
+            return False
+
+        setattr(self, name, value)
+        self.fingerprints[name] = new
+        return True
+
+    def __contains__(self, key):
+        return key in self.keys and getattr(self, self.keys[key]) is not None
+
+    def get(self, key, default = None):
+        return self[key] if key in self else default
+
+    def __eq__(self, other):
+
+        if not isinstance(other, BufferScrollRecord):
+            return NotImplemented
+
+        for name in self.fields:
+
+            if getattr(self, name) != getattr(other, name):
+                return False
+
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        record = BufferScrollRecord()
+
+        for name in self.fields:
+            setattr(record, name, getattr(self, name))
+
+        record.scroll = dict(self.scroll)
+        record.fingerprints = dict(self.fingerprints)
+        return record
+
+    def to_dict(self):
+        return dict((key, self[key]) for key in self.keys if key in self)
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls()
+
+        for key, value in data.items():
+
+            if key in cls.keys:
+                record[key] = value
+
+        return record
+
+    def encode(self):
+        """
+            The record as `R`, its format number, then the fields in order. Numbers are varints,
+            and the strings and encoded regions are prefixed by their length. The settings are
+            written as JSON.
+        """
+        data = bytearray(b'R')
+        data.append(self.format)
+
+        _append_varint(data, self.size)
+        _append_varint(data, len(self.scroll))
+
+        for key, position in sorted(self.scroll.items()):
+            _append_string(data, key)
+            data += self.position.pack(position[0], position[1])
+
+        for name in self.regions:
+            value = encode_regions(getattr(self, name))
+
+            _append_varint(data, len(value))
+            data += value
+
+        _append_string(data, self.color_scheme)
+        _append_string(data, self.syntax)
+        _append_string(data, json.dumps(self.settings) if self.settings else None)
+        _append_string(data, self.path)
+
+        return bytes(data)
+
+    @classmethod
+    def decode(cls, data):
+        """
+            Reads `encode`, a new format would be read here, by its number.
+        """
+
+        if data[1] != cls.format:
+            raise ValueError('Unknown record format: %d' % data[1])
+
+        record = cls()
+        record.size, position = _read_varint(data, 2)
+        count, position = _read_varint(data, position)
+
+        for i in range(count):
+            key, position = _read_string(data, position)
+            record.scroll[key] = cls.position.unpack_from(data, position)
+            position += cls.position.size
+
+        for name in cls.regions:
+            length, position = _read_varint(data, position)
+            setattr(record, name, decode_regions(data[position:position+length]))
+            position += length
+
+        record.color_scheme, position = _read_string(data, position)
+        record.syntax, position = _read_string(data, position)
+        settings, position = _read_string(data, position)
+
+        if settings is not None:
+            record.settings = [tuple(item) for item in json.loads(settings)]
+
+        record.path, position = _read_string(data, position)
+
+        return record
+
+def _append_varint(data, value):
+
+    while value > 127:
+        data.append(value & 127 | 128)
+        value >>= 7
+
+    data.append(value)
+
+def _read_varint(data, position):
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 127) << shift
+
+        if not byte & 128:
+            return value, position
+
+        shift += 7
+
+def _append_string(data, value):
+    """
+        Appends the length plus one, then the utf-8, and 0 for None.
+    """
+
+    if value is None:
+        data.append(0)
+
+    else:
+        value = value.encode('utf-8')
+        _append_varint(data, len(value)+1)
+        data += value
+
+def _read_string(data, position):
+    length, position = _read_varint(data, position)
+
+    if not length:
+        return None, position
+
+    return data[position:position+length-1].decode('utf-8'), position+length-1
+
+def compression_available(codec):
+    """
+        Returns the codec, or `zlib` when its module is not bundled with this Sublime Text build.
+    """
+
+    if codec in ('lzma', 'bz2'):
+
+        try:
+            __import__(codec)
+
+        except ImportError:
+            print('BufferScroll: the %s module is not available, using zlib' % codec)
+            return 'zlib'
+
+    elif codec != 'none':
+        return 'zlib'
+
+    return codec
+
+def compress(data, codec = None, level = None):
+    """
+        Compresses with the `database_compression` setting, or with the given codec.
+
+        There is no header telling the codec, as their outputs start differently: the records start
+        with `R`, zlib with 0x78, lzma with 0xfd, and bz2 with `BZh`. Then the records written with
+        another codec are still read, and they are compressed again only when changed.
+    """
+    codec = codec or preferences.database_compression
+    level = min(max(preferences.database_compression_level if level is None else level, 0), 9)
+
+    if codec == 'none':
+        return data
+
+    if codec == 'lzma':
+        import lzma
+        return lzma.compress(data, preset = level)
+
+    if codec == 'bz2':
+        import bz2
+        return bz2.compress(data, max(level, 1))
+
+    return zlib.compress(data, level)
+
+def decompress(data):
+    first = data[:1]
+
+    if first == b'R':
+        return data
+
+    if first == b'\xfd':
+        import lzma
+        return lzma.decompress(data)
+
+    if first == b'B':
+        import bz2
+        return bz2.decompress(data)
+
+    return zlib.decompress(data)
+
+class BufferScrollUnpickler(Unpickler):
+    """
+        Reads the records of the old `BufferScroll.bin.gz` pickle, refusing anything but plain
+        values, so a crafted database file cannot run code when it is loaded.
+    """
+
+    def find_class(self, module, name):
+
+        if (module, name) == ('collections', 'OrderedDict'):
+            return OrderedDict
+
+        raise ValueError('Unexpected type on the database: %s.%s' % (module, name))
+
+def pack_record(record):
+
+    with profiler.timed('serialize'):
+        data = record.encode()
+
+    with profiler.timed('compress'):
+        return compress(data)
+
+def unpack_record(payload):
+
+    with profiler.timed('decompress'):
+        data = decompress(payload)
+
+    with profiler.timed('deserialize'):
+
+        if data[:1] != b'R':
+            raise ValueError('Unknown record format')
+
+        return BufferScrollRecord.decode(data)
+
+def verified(payload, crc):
+    """
+        Returns the payload, or None when it does not match its crc32.
+    """
+
+    if zlib.crc32(payload) == crc:
+        return payload
+
+    print('BufferScroll: skipping a corrupt record')
+    profiler.count('corrupt_records')
+    return None
+
+def record_key(id):
+    """
+        Records are keyed by the first 8 hex chars of the sha1 of the file path, see `path_id`.
+    """
+    return id.encode('ascii')
+
+def record_id(key):
+    """
+        The id of the record key, or None when the key is corrupt.
+    """
+
+    try:
+        return key.decode('ascii')
+
+    except UnicodeDecodeError:
+        return None
+
+class BufferScrollSnapshot():
+    """
+        The database file, read through mmap.
+
+        The file has a header, then the records, each one packed on its own, and ends with an index
+        sorted by record id. A record is found with a binary search over the index and is decoded
+        only when its view is opened, so opening the database costs the same with 1k or 100k
+        records.
+
+        The index has the crc32 of each record, and a corrupt record is read as a missing one,
+        instead of failing the others.
+    """
+
+    header = struct.Struct('<4sHIQQ')    # magic, version, records count, index offset, next used
+    entry = struct.Struct('<8sQIQI')     # id, record offset, record length, last used, crc32
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.count = 0
+        self.index = 0
+        self.used = 0
+
+    def open(self):
+        """
+            Opens the file, when there is one. A file whose header cannot be read is moved to
+            `BufferScroll.bin.corrupt`, as the next compaction would write over it otherwise.
+        """
+
+        try:
+            self.file = open(self.path, 'rb')
+
+        except (IOError, OSError):
+            return
+
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, self.count, self.index, self.used = self.header.unpack_from(self.map, 0)
+
+            if magic != b'BSDB' or version != self.version:
+                raise ValueError('Unknown database format: %r, version %d' % (magic, version))
+
+        except (IOError, OSError, ValueError, struct.error) as error:
+            self.close()
+
+            print('BufferScroll: could not read the database, moving it to %s.corrupt: %s' % (self.path, error))
+            profiler.count('corrupt_records')
+            os.replace(self.path, self.path+'.corrupt')
+
+    def close(self):
+
+        if self.map:
+            self.map.close()
+
+        if self.file:
+            self.file.close()
+
+        self.file = None
+        self.map = None
+        self.count = 0
+        self.index = 0
+        self.used = 0
+
+    def size(self):
+        return len(self.map) if self.map else 0
+
+    def find(self, key):
+        entry = self.entry
+        low = 0
+        high = self.count
+
+        while low < high:
+            middle = (low+high)//2
+            position = self.index+middle*entry.size
+            current = self.map[position:position+8]
+
+            if current < key:
+                low = middle+1
+
+            elif current > key:
+                high = middle
+
+            else:
+                return entry.unpack_from(self.map, position)
+
+        return None
+
+    def payload(self, key):
+        found = self.find(key)
+
+        if found:
+            return verified(self.map[found[1]:found[1]+found[2]], found[4])
+
+    def entries(self):
+
+        for position in range(self.index, self.index+self.count*self.entry.size, self.entry.size):
+            yield self.entry.unpack_from(self.map, position)
+
+    @classmethod
+    def write(cls, path, items, used):
+        """
+            Writes a new database file from the `(key, payload, used)` items, sorted by key.
+        """
+        index = []
+
+        with open(path, 'wb') as database_file:
+            database_file.write(cls.header.pack(b'BSDB', cls.version, 0, 0, 0))
+
+            for key, payload, last_used in items:
+                index.append(cls.entry.pack(key, database_file.tell(), len(payload), last_used, zlib.crc32(payload)))
+                database_file.write(payload)
+
+            offset = database_file.tell()
+            database_file.write(b''.join(index))
+
+            database_file.seek(0)
+            database_file.write(cls.header.pack(b'BSDB', cls.version, len(index), offset, used))
+
+class BufferScrollJournal():
+    """
+        Append-only log of the records changed after the database file was written.
+
+        Each entry is a small header with the record id, the length of the packed record, when it
+        was last used, the crc32 of the record, and the crc32 of the header before it, followed by
+        the packed record. A length of 0 means the record was dropped. Loading only reads the
+        headers, the records are decoded on demand like the ones in the database file.
+    """
+
+    magic = b'BSJ1'
+    entry = struct.Struct('<8sIQII') # id, record length, last used, record crc32, header crc32
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.size = 0
+
+    def load(self, start = None):
+        """
+            Reads the entries headers. With `start`, only the entries after it are read, as the ones
+            appended by another instance. Returns the ids read.
+        """
+        ids = []
+
+        if start is None:
+            self.index = {}
+
+        try:
+            journal_file = open(self.path, 'r+b')
+
+        except (IOError, OSError):
+            self.clear()
+            return ids
+
+        with journal_file:
+
+            if start is not None:
+                journal_file.seek(start)
+
+            elif journal_file.read(len(self.magic)) != self.magic:
+                journal_file.seek(0)
+                journal_file.truncate()
+                journal_file.write(self.magic)
+
+            entry = self.entry
+
+            # an entry cut by a crash only loses itself, the good entries before it are kept
+            good = journal_file.tell()
+            size = journal_file.seek(0, 2)
+            journal_file.seek(good)
+
+            # as does a corrupt header, as the entries after it cannot be found
+            while good+entry.size <= size:
+                header = journal_file.read(entry.size)
+                key, length, used, crc, header_crc = entry.unpack(header)
+
+                if zlib.crc32(header[:-4]) != header_crc:
+                    print('BufferScroll: the journal has a corrupt entry, dropping it and the ones after it')
+                    profiler.count('corrupt_records')
+                    break
+
+                id = record_id(key)
+
+                if id is None or good+entry.size+length > size:
+                    break
+
+                ids.append(id)
+                self.index[id] = (good+entry.size, length, used, crc)
+                good = journal_file.seek(length, 1)
+
+            if good != size:
+                journal_file.truncate(good)
+
+            self.size = good
+
+        # log( 2, 'journal replayed, bytes: '+str(self.size) )
+        return ids
+
+    def append(self, items):
+
+        if not items:
+            return
+
+        with open(self.path, 'ab') as journal_file:
+            position = start = journal_file.tell()
+
+            for key, payload, used in items:
+                crc = zlib.crc32(payload)
+                journal_file.write(self.header(key, len(payload), used, crc))
+                journal_file.write(payload)
+
+                position += self.entry.size
+                self.index[key.decode('ascii')] = (position, len(payload), used, crc)
+                position += len(payload)
+
+            profiler.count('bytes_written', position-start)
+            self.size = position
+
+    def payload(self, id):
+        """
+            Returns None when the entry is not there anymore, as another instance compacted the
+            journal after we read it, and False when it is corrupt.
+        """
+        offset, length, used, crc = self.index[id]
+        entry = self.entry
+        header = self.header(record_key(id), length, used, crc)
+
+        with open(self.path, 'rb') as journal_file:
+            journal_file.seek(offset-entry.size)
+            data = journal_file.read(entry.size+length)
+
+        if len(data) != entry.size+length or data[:entry.size] != header:
+            return None
+
+        return verified(data[entry.size:], crc) or False
+
+    def header(self, key, length, used, crc):
+        header = self.entry.pack(key, length, used, crc, 0)[:-4]
+        return header + struct.pack('<I', zlib.crc32(header))
+
+    def clear(self):
+
+        with open(self.path, 'wb') as journal_file:
+            journal_file.write(self.magic)
+
+        self.index = {}
+        self.size = len(self.magic)
+
+class BufferScrollFileLock():
+    """
+        Exclusive lock between the application instances sharing the database, as a portable and an
+        installed copy using the same `Settings` folder. Without the `portalocker` dependency,
+        nothing is locked.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+        # file locks do not exclude the threads of the same process on every platform
+        self.thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+
+        try:
+            import portalocker
+
+        except ImportError:
+            return self
+
+        try:
+            self.file = open(self.path, 'a+b')
+            portalocker.lock(self.file, portalocker.LOCK_EX)
+
+        except:
+            self.__exit__()
+            raise
+
+        return self
+
+    def __exit__(self, *args):
+
+        try:
+
+            if self.file:
+                import portalocker
+
+                portalocker.unlock(self.file)
+                self.file.close()
+
+        finally:
+            self.file = None
+            self.thread_lock.release()
+
+def file_stat(path):
+    """
+        Returns what changes when another instance writes the file, or None when there is no file.
+    """
+
+    try:
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    except (IOError, OSError):
+        return None
+
+class BufferScrollDatabase():
+    """
+        Dictionary like access to the records, as `data_base[id]`.
+
+        Records are read from the journal or the database file the first time their view asks for
+        them, and the last used ones are kept decoded in memory, up to `max_cached_records`. Records
+        changed in memory stay there until the save thread writes them to the journal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.snapshot = BufferScrollSnapshot(path)
+        self.journal = BufferScrollJournal(path+'.journal')
+        self.file_lock = BufferScrollFileLock(path+'.lock')
+        self.snapshot_stat = None
+
+        self.cache = OrderedDict()
+        self.unsaved = {}
+        self.removed = set()
+
+        # the records used without changing them, by their new last used time, see `touch`
+        self.touched = {}
+        self.count = 0
+        self.used = 0
+        self.timings = OrderedDict()
+
+        # when each record was last used, from the oldest, and the size of each record on disk,
+        # built by the save thread, the first time it evicts records
+        self.usage = None
+        self.sizes = {}
+        self.total_size = 0
+        self.written_fields = Counter()
+
+    def load(self, legacy = None):
+
+        with self.file_lock, self.lock:
+            start = time.time()
+
+            if legacy and not lexists(self.path) and lexists(legacy):
+                self.migrate(legacy)
+                self.timings['migrate'] = time.time()-start
+
+            start = time.time()
+            self.snapshot.open()
+            self.snapshot_stat = file_stat(self.path)
+            self.timings['open_database'] = time.time()-start
+
+            start = time.time()
+            self.journal.load()
+            self.timings['open_journal'] = time.time()-start
+
+            self.recount()
+
+    def recount(self):
+        """
+            Counts the records from the database file, the journal entries over it, and the records
+            not written yet.
+        """
+        self.count = self.snapshot.count
+        self.used = max(self.used, self.snapshot.used)
+
+        for id, (offset, length, used, crc) in self.journal.index.items():
+            in_snapshot = self.snapshot.find(record_key(id)) is not None
+
+            if length and not in_snapshot:
+                self.count += 1
+
+            elif not length and in_snapshot:
+                self.count -= 1
+
+            self.used = max(self.used, used+1)
+
+        for id in self.unsaved:
+
+            if not self.on_disk(id):
+                self.count += 1
+
+        for id in self.removed:
+
+            if self.on_disk(id):
+                self.count -= 1
+
+    def on_disk(self, id):
+
+        if id in self.journal.index:
+            return self.journal.index[id][1] > 0
+
+        return self.snapshot.find(record_key(id)) is not None
+
+    def refresh(self):
+        """
+            Reads what other instances wrote since we last read or wrote the files, with the file
+            lock held. When nothing changed, it only costs two `stat` calls.
+
+            Records are merged by their last used time: our cached copy of a record another instance
+            wrote is dropped, and so are our unsaved changes, when theirs are newer.
+        """
+        journal_stat = file_stat(self.journal.path)
+
+        if self.snapshot_stat == file_stat(self.path) \
+                and journal_stat is not None and journal_stat[1] == self.journal.size:
+            return
+
+        with self.lock:
+
+            # the other instance compacted the database
+            if self.snapshot_stat != file_stat(self.path) or journal_stat is None or journal_stat[1] < self.journal.size:
+                self.snapshot.close()
+                self.snapshot.open()
+                self.snapshot_stat = file_stat(self.path)
+                self.journal.load()
+
+                changed = set(self.cache) | set(self.unsaved)
+
+            else:
+                changed = set(self.journal.load(self.journal.size))
+
+            for id in changed:
+                if id in self.journal.index:
+                    used = self.journal.index[id][2]
+
+                else:
+                    entry = self.snapshot.find(record_key(id))
+                    used = entry[3] if entry else 0
+
+                if id in self.unsaved and self.unsaved[id] < used:
+                    del self.unsaved[id]
+
+                if id not in self.unsaved:
+                    self.cache.pop(id, None)
+
+            self.recount()
+            self.usage = None
+
+        profiler.count('merges')
+
+    def migrate(self, legacy):
+        """
+            Converts the old `BufferScroll.bin.gz` pickle.
+        """
+        items = self.legacy_items(legacy)
+
+        if items is None:
+            return
+
+        BufferScrollSnapshot.write(self.path+'.tmp', items, int(time.time()*1000))
+        rename(self.path+'.tmp', self.path)
+
+        self.remove_legacy(legacy)
+
+    def legacy_items(self, legacy):
+        """
+            Returns the `(key, payload, used)` of the records in the old pickle, sorted by key, or
+            None when it cannot be read. The pickle kept the records from the least used, they are
+            dated one millisecond apart before now, in that order.
+        """
+
+        from gzip import GzipFile
+
+        try:
+            gz = GzipFile(legacy, 'rb')
+            data = OrderedDict(BufferScrollUnpickler(gz).load())
+            gz.close()
+
+        except:
+            # keep the old file around, instead of replacing it by an empty database
+            return
+
+        now = int(time.time()*1000)
+
+        ranks = dict((id, now-len(data)+used) for used, id in enumerate(data))
+        return [(record_key(id), pack_record(BufferScrollRecord.from_dict(data[id])), ranks[id]) for id in sorted(data)]
+
+    def remove_legacy(self, legacy):
+
+        try:
+            remove(legacy)
+
+        except:
+            pass
+
+    def close(self):
+
+        with self.lock:
+            self.snapshot.close()
+
+    def memory(self):
+        """
+            Estimates the bytes used by the decoded records and the journal index, the database file
+            is mapped, and not counted.
+        """
+
+        with self.lock:
+            size = sys.getsizeof(self.cache) + sys.getsizeof(self.journal.index)
+
+            for id, record in self.cache.items():
+                size += sys.getsizeof(id) + sys.getsizeof(record)
+
+                for name in BufferScrollRecord.fields:
+                    size += sys.getsizeof(getattr(record, name))
+
+            for id, entry in self.journal.index.items():
+                size += sys.getsizeof(id) + sys.getsizeof(entry)
+
+        return size
+
+    def payload(self, id):
+        """
+            Returns None when there is no record, and False when another instance compacted the
+            journal, and it has to be read again.
+        """
+
+        if id in self.journal.index:
+
+            if not self.journal.index[id][1]:
+                return None
+
+            payload = self.journal.payload(id)
+            return False if payload is None else payload or None
+
+        return self.snapshot.payload(record_key(id))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, id):
+
+        with self.lock:
+            return id not in self.removed and (id in self.cache or self.on_disk(id))
+
+    def __getitem__(self, id):
+
+        with self.lock:
+
+            if id in self.removed:
+                raise KeyError(id)
+
+            if id in self.cache:
+                self.cache.move_to_end(id)
+                return self.cache[id]
+
+            payload = self.payload(id)
+
+            if payload is not False:
+                return self.decode(id, payload)
+
+        # the file lock is always taken before the lock, as the save thread does
+        with self.file_lock:
+            self.refresh()
+
+        with self.lock:
+            return self.decode(id, self.payload(id) or None)
+
+    def decode(self, id, payload):
+
+        if payload is None:
+            raise KeyError(id)
+
+        try:
+            record = unpack_record(payload)
+
+        except Exception as error:
+            print('BufferScroll: skipping the corrupt record %s: %s' % (id, error))
+            profiler.count('corrupt_records')
+            raise KeyError(id)
+
+        self.cache[id] = record
+        self.trim()
+
+        return record
+
+    def get(self, id, default = None):
+        """
+            Returns the record, or `default` when there is none, or when it is corrupt.
+        """
+
+        try:
+            return self[id]
+
+        except KeyError:
+            return default
+
+    def __setitem__(self, id, record):
+
+        with self.lock:
+
+            if id not in self:
+                self.count += 1
+
+            self.removed.discard(id)
+            self.cache[id] = record
+            self.move_to_end(id)
+            self.trim()
+
+    def __delitem__(self, id):
+        """
+            Forgets the record, the save thread removes it from disk on its next flush.
+        """
+
+        with self.lock:
+
+            if id not in self:
+                raise KeyError(id)
+
+            self.count -= 1
+            self.removed.add(id)
+            self.cache.pop(id, None)
+            self.unsaved.pop(id, None)
+
+    def move_to_end(self, id):
+        """
+            Marks the record as the last used, and as changed, until it is written to the journal.
+        """
+
+        with self.lock:
+            # the last used times are in milliseconds, and never repeat
+            self.used = max(self.used, int(time.time()*1000))
+            self.unsaved[id] = self.used
+            self.used += 1
+
+            if self.usage is not None:
+                self.usage[id] = self.unsaved[id]
+                self.usage.move_to_end(id)
+
+    def touch(self, id):
+        """
+            Marks the record as the last used, without changing it, as when its file is opened or
+            activated. Only the last used time is written, with the next flush.
+        """
+
+        with self.lock:
+
+            if id in self.unsaved or id not in self:
+                return
+
+            self.used = max(self.used, int(time.time()*1000))
+            self.touched[id] = self.used
+            self.used += 1
+
+            if self.usage is not None and id in self.usage:
+                self.usage[id] = self.touched[id]
+                self.usage.move_to_end(id)
+
+    def trim(self):
+
+        if len(self.cache) > preferences.max_cached_records:
+
+            for id in list(self.cache):
+
+                if id not in self.unsaved:
+                    del self.cache[id]
+
+                    if len(self.cache) <= preferences.max_cached_records:
+                        break
+
+    def flush(self, changes):
+        """
+            Appends the changed records to the journal, `changes` has the names of the changed
+            fields of each record. Only called by the save thread.
+        """
 
-# Enable debug messages: (bitwise)
-#
-# 0   - Disabled debugging.
-# 1   - Basic logging messages.
-# 2   - Original levels from tito
-#
-# Debugger settings: 0 - disabled, 127 - enabled
-log = getLogger( 127, __name__ )
+        with self.file_lock:
+            self.refresh()
+            self.write(changes)
 
-#log.setup( "Debug.txt" )
-#log.clear()
+    def write(self, changes):
+        items = []
 
-# log( 1, "Debugging" )
-# log( 1, "..." )
-# log( 1, "..." )
+        if self.usage is None:
+            self.index_usage()
 
-# import inspect
-database = ""
-preferences = None
-BufferScrollAPI = None
+        with self.lock:
+            changed = [(id, self.cache[id], self.unsaved[id]) for id in changes if id in self.unsaved]
+            removed = list(self.removed)
+            touched = self.touched_items()
 
-data_base = OrderedDict()
-g_settings = None
-already_restored = {}
-scroll_already_restored = {}
+        for id, record, used in changed:
+            items.append((record_key(id), pack_record(record), used))
+            self.written_fields.update(changes[id])
 
-last_focused_view_name = ''
-disable_scroll_restoring = False
-g_isToAllowSelectOperationOnTheClonedView = False
+        with profiler.timed('journal_append'):
+            self.journal.append(items + touched)
 
+        profiler.count('flushes')
+        profiler.count('records_written', len(changed))
 
-def plugin_loaded():
-    global database, preferences, BufferScrollAPI, data_base, g_settings
+        with self.lock:
 
-    # open
-    database = dirname(sublime.packages_path())+'/Settings/BufferScroll.bin.gz'
+            # by the ids, without decoding the keys again
+            for (id, record, used), (key, payload, last_used) in zip(changed, items):
+                self.total_size += len(payload) - self.sizes.get(id, 0)
+                self.sizes[id] = len(payload)
 
-    try:
-        makedirs(dirname(database))
+            # the record may have changed again while we were writing it
+            for id, record, used in changed:
 
-    except:
-        pass
+                if self.unsaved.get(id) == used:
+                    del self.unsaved[id]
 
-    try:
-        gz = GzipFile(database, 'rb')
-        data_base = load(gz);
-        gz.close()
+            for id in removed:
+                self.usage.pop(id, None)
+                self.total_size -= self.sizes.pop(id, 0)
 
-        if not isinstance(data_base, OrderedDict):
-            data_base = OrderedDict(data_base)
-    except:
-        data_base = OrderedDict()
+        self.journal.append([(record_key(id), b'', 0) for id in removed if self.on_disk(id)]
+                + [(record_key(id), b'', 0) for id in self.evict()])
 
-    # settings
-    g_settings = sublime.load_settings('BufferScroll.sublime-settings')
-    preferences = Preferences()
-    preferences.load()
+        with self.lock:
+            self.removed.difference_update(removed)
 
-    g_settings.clear_on_change('BufferScroll')
-    g_settings.add_on_change('BufferScroll', lambda:preferences.load())
+        if self.needs_compaction():
 
-    BufferScrollAPI = BufferScroll()
+            with profiler.timed('compact'):
+                self.compact()
 
-    # threads listening scroll, and waiting to set data on focus change
-    if not 'running_synch_data_loop' in globals():
-        global running_synch_data_loop
+    def touched_items(self):
+        """
+            Returns the `(key, payload, used)` of the touched records, with their payload as it is
+            stored. The records written in the last hour, by us or by another instance, are skipped,
+            so switching between a few tabs does not copy them to the journal again and again.
+        """
+        items = []
 
-        running_synch_data_loop = True
-        thread.start_new_thread(synch_data_loop, ())
+        for id, used in self.touched.items():
 
-    if not 'running_synch_scroll_loop' in globals():
-        global running_synch_scroll_loop
+            if id in self.unsaved or id in self.removed:
+                continue
 
-        running_synch_scroll_loop = True
-        thread.start_new_thread(synch_scroll_loop, ())
+            if id in self.journal.index:
+                stored = self.journal.index[id][2]
 
+            else:
+                entry = self.snapshot.find(record_key(id))
+                stored = entry[3] if entry else used
 
-def plugin_unloaded():
-    g_settings.clear_on_change('BufferScroll')
+            if used - stored < 3600000:
+                continue
 
+            payload = self.payload(id)
 
-def is_cloned_view( target_view ):
-    views             = sublime.active_window().views()
-    target_buffer_id  = target_view.buffer_id()
-    views_buffers_ids = []
+            if payload:
+                items.append((record_key(id), payload, used))
 
-    for view in views:
-        views_buffers_ids.append( view.buffer_id() )
+        self.touched = {}
+        return items
 
-    if target_buffer_id in views_buffers_ids:
-        views_buffers_ids.remove( target_buffer_id )
+    def index_usage(self):
+        """
+            Builds the index of when each record was last used, and of its size, from the database
+            file and the journal. Only the save thread changes them, so they are read unlocked.
+        """
+        entries = {}
 
-    # log( 1, "( fix_project_switch_restart_bug.py ) Is a cloned view: {0}".format( target_view.buffer_id() in views_buffers_ids ) )
-    return target_buffer_id in views_buffers_ids
+        for key, offset, length, used, crc in self.snapshot.entries():
+            id = record_id(key)
 
+            if id is not None:
+                entries[id] = (used, length)
 
-class Preferences():
-    @classmethod
-    def load(cls):
-        cls.remember_color_scheme                       = g_settings.get('remember_color_scheme', False)
-        cls.remember_syntax                             = g_settings.get('remember_syntax', False)
-        cls.synch_bookmarks                             = g_settings.get('synch_bookmarks', False)
-        cls.synch_marks                                 = g_settings.get('synch_marks', False)
-        cls.synch_folds                                 = g_settings.get('synch_folds', False)
-        cls.synch_scroll                                = g_settings.get('synch_scroll', False)
-        cls.typewriter_scrolling                        = g_settings.get('typewriter_scrolling', False)
-        cls.typewriter_scrolling_shift                  = int(g_settings.get('typewriter_scrolling_shift', 0))
-        cls.typewriter_scrolling_follow_cursor_movement = g_settings.get('typewriter_scrolling_follow_cursor_movement', True)
-        cls.use_animations                              = g_settings.get('use_animations', False)
-        cls.i_use_cloned_views                          = g_settings.get('i_use_cloned_views', False)
-        cls.max_database_records                        = g_settings.get('max_database_records', 500)
-        cls.restore_scroll                              = g_settings.get('restore_scroll', True)
-        cls.remember_settings_list                      = g_settings.get('remember_settings_list', [])
-
-        cls.current_view_id                             = -1
-
-        cls.synch_data_running                          = False
-        cls.synch_scroll_running                        = False
-        cls.synch_scroll_last_view_id                   = 0
-        cls.synch_scroll_last_view_position             = 0
-        cls.synch_scroll_current_view_object            = None
-        cls.writing_to_disk                             = False
+        for id, (offset, length, used, crc) in self.journal.index.items():
 
-    # syntax specific settings
-    @classmethod
-    def get(cls, type, view):
-        if view.settings().has('bs_sintax'):
-            syntax = view.settings().get('bs_sintax')
-        else:
-            syntax = view.settings().get('syntax')
-            syntax = basename(syntax).split('.')[0].lower() if syntax != None else "plain text"
-            view.settings().set('bs_sintax', syntax);
+            if length:
+                entries[id] = (used, length)
 
-        # log( 1, "preferences: " + str( preferences ) )
-        # log( 1, "preferences: " + syntax )
+            else:
+                entries.pop(id, None)
 
-        if syntax and hasattr(preferences, syntax) and type in getattr(preferences, syntax):
-            return getattr(preferences, syntax)[type];
+        usage = OrderedDict()
 
-        elif syntax and hasattr(preferences, syntax) and type not in getattr(preferences, syntax):
-            return getattr(preferences, type)
+        for id in sorted(entries, key = lambda id: entries[id][0]):
+            usage[id] = entries[id][0]
 
-        elif syntax and g_settings.has(syntax):
-            setattr(preferences, syntax, g_settings.get(syntax))
-            cls.get(type, view);
+        with self.lock:
+            self.sizes = dict((id, length) for id, (used, length) in entries.items())
+            self.total_size = sum(self.sizes.values())
 
-        else:
-            return getattr(preferences, type)
+            # the records changed or used since the save thread started are the last used ones
+            for id, used in sorted(list(self.touched.items()) + list(self.unsaved.items()), key = lambda item: item[1]):
+
+                if id in usage or id in self.unsaved:
+                    usage[id] = used
+                    usage.move_to_end(id)
+
+            self.usage = usage
+
+    def evict(self):
+        """
+            Drops the least used records while there are more than `max_database_records`, while
+            they take more than `max_database_size` bytes on disk, or when they were not used for
+            `max_database_age` days. Starts from the oldest, so it only looks at the records it
+            evicts, and the next one.
+        """
+        evicted = []
+        oldest = (time.time() - preferences.max_database_age * 86400) * 1000
+
+        with self.lock:
+
+            while self.usage:
+                id, used = next(iter(self.usage.items()))
+
+                # changed records are never the oldest, unless the limits are too small
+                if id in self.unsaved:
+                    break
+
+                if self.count <= preferences.max_database_records \
+                        and self.total_size <= preferences.max_database_size \
+                        and (not preferences.max_database_age or used >= oldest):
+                    break
+
+                del self.usage[id]
+                self.total_size -= self.sizes.pop(id, 0)
+                self.cache.pop(id, None)
+                self.count -= 1
+                evicted.append(id)
+
+        return evicted
+
+    def needs_compaction(self):
+        """
+            Compacts when the journal passes the maximum size, or when it is already much bigger
+            than the database file it is applied over.
+        """
+        size = self.journal.size
+
+        if size > preferences.journal_compact_size:
+            return True
+
+        return size > 65536 and size > self.snapshot.size() * preferences.journal_compact_ratio
+
+    def payloads(self):
+        """
+            Returns the packed records, as they are stored.
+        """
+
+        with self.file_lock:
+            self.refresh()
+
+            with open(self.journal.path, 'rb') as journal_file:
+                return [payload for key, payload, used in self.packed_items(journal_file)]
+
+    def packed_items(self, journal_file):
+        """
+            Yields the `(key, payload, used)` of the records, sorted by key, as they are stored.
+            The corrupt records are skipped.
+        """
+        live = {}
+
+        for key, offset, length, used, crc in self.snapshot.entries():
+            live[key] = (True, offset, length, used, crc)
+
+        for id, (offset, length, used, crc) in self.journal.index.items():
+            key = record_key(id)
+
+            if length:
+                live[key] = (False, offset, length, used, crc)
+
+            else:
+                live.pop(key, None)
+
+        for key in sorted(live):
+            in_snapshot, offset, length, used, crc = live[key]
+
+            if in_snapshot:
+                payload = self.snapshot.map[offset:offset+length]
+
+            else:
+                journal_file.seek(offset)
+                payload = journal_file.read(length)
+
+            if verified(payload, crc) is not None:
+                yield key, payload, used
+
+    def compact(self):
+        """
+            Writes the journal and the database file into a new database file. The records are
+            copied as they are stored, without decoding them.
+        """
+
+        with open(self.journal.path, 'rb') as journal_file:
+            BufferScrollSnapshot.write(self.path+'.tmp', self.packed_items(journal_file), self.used)
+
+        profiler.count('compactions')
+        profiler.count('bytes_written', os.path.getsize(self.path+'.tmp'))
+
+        with self.lock:
+            self.snapshot.close()
+
+            with profiler.timed('rename'):
+
+                try:
+                    os.replace(self.path+'.tmp', self.path)
+
+                except (IOError, OSError):
+                    # on Windows, another instance may have the database file mapped, then the
+                    # journal is kept, and the compaction is tried again on the next flush
+                    self.snapshot.open()
+                    remove(self.path+'.tmp')
+                    return
+
+            # if we crash before this, the journal is applied again over the new database file,
+            # and as its entries are whole records, the result is the same
+            self.journal.clear()
+            self.snapshot.open()
+            self.snapshot_stat = file_stat(self.path)
+            self.recount()
+
+class BufferScrollSqliteDatabase(BufferScrollDatabase):
+    """
+        The records in a SQLite database, in WAL mode, when the `database_backend` setting is
+        `sqlite`.
+
+        Each record is a row keyed by its id, with the same packed payload as the database file.
+        Reading a record is a lookup by id, a flush is one transaction writing the changed rows, and
+        eviction walks the `last_used` index from the oldest row. The views read through their own
+        connection, so they are not blocked while the save thread writes.
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, last_used INTEGER NOT NULL, '
+                'size INTEGER NOT NULL, record BLOB NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS records_last_used ON records (last_used)',
+    )
+
+    def __init__(self, path):
+        BufferScrollDatabase.__init__(self, path)
+        self.reader = None
+        self.writer = None
+        self.data_version = None
+
+    def connect(self):
+        import sqlite3
+
+        # the transactions are explicit, and each connection is used by one thread at a time
+        connection = sqlite3.connect(self.path, timeout = 10, isolation_level = None, check_same_thread = False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def load(self, legacy = None):
+
+        with self.lock:
+            start = time.time()
+            exists = lexists(self.path)
+
+            self.writer = self.connect()
+
+            for statement in self.schema:
+                self.writer.execute(statement)
+
+            self.reader = self.connect()
+            self.timings['open_database'] = time.time()-start
+
+            if not exists:
+                start = time.time()
+                self.migrate(legacy)
+                self.timings['migrate'] = time.time()-start
+
+            self.recount()
+
+    def migrate(self, legacy):
+        """
+            Copies the records of the database file, or of the old pickle when there is no database
+            file, as they are stored. The database file is kept, to switch back to it.
+        """
+        database_file = dirname(self.path)+'/BufferScroll.bin'
+
+        # the records may be only on the journal, until it is compacted
+        if lexists(database_file) or lexists(database_file+'.journal'):
+            source = BufferScrollDatabase(database_file)
+            source.load()
+
+            with open(source.journal.path, 'rb') as journal_file:
+                self.insert(list(source.packed_items(journal_file)))
+
+            source.close()
+
+        elif legacy and lexists(legacy):
+            items = self.legacy_items(legacy)
+
+            if items is not None:
+                self.insert(items)
+                self.remove_legacy(legacy)
+
+    def insert(self, items):
+        """
+            Inserts the `(key, payload, used)` items.
+        """
+        rows = [(record_id(key), used, len(payload), bytes(payload))
+                for key, payload, used in items if record_id(key) is not None]
+
+        self.writer.execute('BEGIN IMMEDIATE')
+        self.writer.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)', rows)
+        self.writer.execute('COMMIT')
+
+    def close(self):
+
+        with self.lock:
+
+            for connection in (self.reader, self.writer):
+
+                if connection:
+                    connection.close()
+
+            self.reader = None
+            self.writer = None
+
+    def recount(self):
+        """
+            Counts the rows, and the records not written yet. Only called when another instance
+            changed the database, as counting reads the whole index.
+        """
+        count, total_size, used = self.writer.execute('SELECT COUNT(*), TOTAL(size), MAX(last_used) FROM records').fetchone()
+
+        with self.lock:
+            self.count = count + len([id for id in self.unsaved if not self.on_disk(id)]) \
+                    - len([id for id in self.removed if self.on_disk(id)])
+            self.total_size = int(total_size)
+            self.used = max(self.used, (used or 0)+1)
+
+        self.data_version = self.writer.execute('PRAGMA data_version').fetchone()[0]
+
+    def payloads(self):
+
+        with self.lock:
+            return [row[0] for row in self.reader.execute('SELECT record FROM records')]
+
+    def on_disk(self, id):
+        return self.reader.execute('SELECT 1 FROM records WHERE id = ?', (id,)).fetchone() is not None
+
+    def payload(self, id):
+        row = self.reader.execute('SELECT record FROM records WHERE id = ?', (id,)).fetchone()
+        return row[0] if row else None
+
+    def flush(self, changes):
+        """
+            Writes the changed records in one transaction. A record another instance wrote after we
+            changed it is not overwritten, and our copy of it is dropped.
+        """
 
+        # the version only changes with the writes of other connections
+        if self.writer.execute('PRAGMA data_version').fetchone()[0] != self.data_version:
+            self.recount()
 
+            with self.lock:
+
+                for id in list(self.cache):
+
+                    if id not in self.unsaved:
+                        del self.cache[id]
+
+            profiler.count('merges')
+
+        with self.lock:
+            changed = [(id, self.cache[id], self.unsaved[id]) for id in changes if id in self.unsaved]
+            removed = list(self.removed)
+            touched = [(used, id, used-3600000) for id, used in self.touched.items() if id not in self.unsaved]
+            self.touched = {}
+
+        items = []
+
+        for id, record, used in changed:
+            items.append((id, pack_record(record), used))
+            self.written_fields.update(changes[id])
+
+        newer = []
+
+        with profiler.timed('transaction'):
+            self.writer.execute('BEGIN IMMEDIATE')
+
+            try:
+
+                for id, payload, used in items:
+                    row = self.writer.execute('SELECT last_used, size FROM records WHERE id = ?', (id,)).fetchone()
+
+                    if row and row[0] > used:
+                        newer.append(id)
+                        continue
+
+                    self.writer.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)', (id, used, len(payload), payload))
+                    self.total_size += len(payload) - (row[1] if row else 0)
+
+                # unless it was written in the last hour, see `touched_items`
+                self.writer.executemany('UPDATE records SET last_used = ? WHERE id = ? AND last_used < ?', touched)
+
+                for id in removed:
+                    row = self.writer.execute('SELECT size FROM records WHERE id = ?', (id,)).fetchone()
+
+                    if row:
+                        self.writer.execute('DELETE FROM records WHERE id = ?', (id,))
+                        self.total_size -= row[0]
+
+                evicted = self.evict()
+                self.writer.executemany('DELETE FROM records WHERE id = ?', [(id,) for id in evicted])
+                self.writer.execute('COMMIT')
+
+            except:
+                self.writer.execute('ROLLBACK')
+                raise
+
+        profiler.count('flushes')
+        profiler.count('records_written', len(items)-len(newer))
+        profiler.count('bytes_written', sum(len(payload) for id, payload, used in items))
+
+        with self.lock:
+            self.removed.difference_update(removed)
+
+            for id, record, used in changed:
+
+                if self.unsaved.get(id) == used:
+                    del self.unsaved[id]
+
+                    if id in newer:
+                        self.cache.pop(id, None)
+
+    def evict(self):
+        """
+            Drops the oldest rows, as `BufferScrollDatabase.evict`, stepping through the `last_used`
+            index only while rows are evicted.
+        """
+        evicted = []
+        oldest = (time.time() - preferences.max_database_age * 86400) * 1000
+
+        rows = self.writer.execute('SELECT id, last_used, size FROM records ORDER BY last_used')
+
+        with self.lock:
+
+            for id, used, size in rows:
+
+                if id in self.unsaved:
+                    break
+
+                if self.count <= preferences.max_database_records \
+                        and self.total_size <= preferences.max_database_size \
+                        and (not preferences.max_database_age or used >= oldest):
+                    break
+
+                self.total_size -= size
+                self.cache.pop(id, None)
+                self.count -= 1
+                evicted.append(id)
+
+        return evicted
 
 class BufferScrollSaveThread(threading.Thread):
+    """
+        The single thread writing the database to disk.
+
+        Saves only mark their record as dirty, and the changes are flushed together once no other
+        change arrived for `save_debounce_delay` milliseconds, or once the oldest pending change
+        waited `save_max_latency` milliseconds, then switching tabs quickly costs one write.
+    """
 
     def __init__(self):
         threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.pending = {}
+        self.running = True
+
+        self.first_change = 0
+        self.last_change = 0
+
+    def schedule(self, id, fields):
+        """
+            Marks the fields of the record as changed.
+        """
+
+        with self.condition:
+            self.pending.setdefault(id, set()).update(fields)
+            self.last_change = time.time()
+
+            if not self.first_change:
+                self.first_change = self.last_change
+
+            self.condition.notify()
+
+    def stop(self):
+
+        with self.condition:
+            self.running = False
+            self.condition.notify()
 
     def run(self):
 
-        if not preferences.writing_to_disk:
-            preferences.writing_to_disk = True
+        while True:
 
-            # log( 2, "" )
-            # log( 2, 'WRITING TO DISK' )
-            start = time.time()
+            with self.condition:
 
-            while len(data_base) > preferences.max_database_records:
-                data_base.popitem(last = False)
+                while self.running and not self.first_change:
+                    self.condition.wait()
 
-            gz = GzipFile(database+'.tmp', 'wb')
-            dump(data_base, gz, -1)
-            gz.close()
+                while self.running:
+                    deadline = min(self.last_change + preferences.save_debounce_delay / 1000.0,
+                            self.first_change + preferences.save_max_latency / 1000.0)
+                    now = time.time()
 
-            try:
-                remove(database)
+                    if now >= deadline:
+                        break
 
-            except:
-                pass
+                    self.condition.wait(deadline - now)
+
+                if not self.running:
+                    break
+
+                self.first_change = 0
+
+            self.flush()
+
+    def flush(self):
+        """
+            Writes the pending records. Also called from `plugin_unloaded`, so nothing is lost when
+            the plugin goes away before the next flush.
+        """
+
+        with self.write_lock:
+
+            with self.condition:
+                pending = self.pending
+                self.pending = {}
+                self.first_change = 0
 
+            # log( 2, "" )
+            # log( 2, 'WRITING TO DISK' )
             try:
-                rename(database+'.tmp', database)
 
-            except:
-                pass
+                with profiler.timed('flush'):
+                    data_base.flush(pending)
 
-            # log( 2, 'time expend writting to disk', time.time()-start )
-            preferences.writing_to_disk = False
+            except Exception as error:
+                print('BufferScroll: could not write the database, trying again later: %s' % error)
+
+                # the records stay unsaved in memory, until a flush succeeds
+                with self.condition:
+
+                    for id, fields in pending.items():
+                        self.pending.setdefault(id, set()).update(fields)
+
+                    self.last_change = time.time()
+
+                    if not self.first_change:
+                        self.first_change = self.last_change
 
 class BufferScroll(sublime_plugin.EventListener):
 
+    def on_new_async(self, view):
+        clone_registry.add(view)
+
+    def on_close(self, view):
+        clone_registry.remove(view)
+        unlink_view(view)
+        view_paths.pop(view.id(), None)
+
+        for kind in ('bookmarks', 'marks', 'folds'):
+            key = (view.buffer_id(), kind)
+
+            if view.buffer_id() not in clone_registry.buffers:
+                region_versions.pop(key, None)
+
+            elif key in region_versions:
+                region_versions[key][1].discard(view.id())
+
+        Preferences.forget(view)
+        restore_queue.pop(view.id(), None)
+
+        save_change_counts.pop(view.id(), None)
+        regions_dirty.discard(view.id())
+
+    def on_post_window_command(self, window, command, args):
+        # the views may have moved to other groups or windows
+        clone_registry.invalidate(window = window)
+
     def on_load_async(self, view):
         """
             Restore on load for new opened tabs or previews.
@@ -219,11 +2783,17 @@ class BufferScroll(sublime_plugin.EventListener):
             Otherwise, it is some fancy feature as Go To Symbol or a file which was opened with the
             command line with `subl file.txt 100:9` (Line 100, Column 9).
         """
+        clone_registry.add(view)
         is_allowed = self._scroll_restoring_allowed( view )
         # log( 1, "is_allowed: %s", is_allowed )
 
         if is_allowed:
-            self.restore(view, 'on_load')
+
+            if self.is_visible(view):
+                self.restore(view, 'on_load')
+
+            else:
+                self.queue_restore(view)
 
         else:
             global disable_scroll_restoring
@@ -257,18 +2827,44 @@ class BufferScroll(sublime_plugin.EventListener):
 
     # ST BUG tps://github.com/SublimeTextIssues/Core/issues/9
     def on_reload_async(self, view):
+        Preferences.forget(view)
         self.restore(view, 'on_reload')
 
     # restore on load for cloned views
     def on_clone_async(self, view):
+        clone_registry.add(view)
+        clone_registry.add(sublime.active_window().active_view())
+
         # ST BUG https://github.com/SublimeTextIssues/Core/issues/8
         self.restore(sublime.active_window().active_view(), 'on_clone')
+        self.arm_synch_scroll(view)
+
+    # there is no scroll event, these tell us the user is doing something which may scroll
+    def on_selection_modified_async(self, view):
+        self.arm_synch_scroll(view)
+
+    def on_modified_async(self, view):
+
+        if view.id() in scroll_links:
+            scroll_links[view.id()].edited(view)
+
+        self.arm_synch_scroll(view)
+
+        if preferences.get('synch_folds', view):
+            self.schedule_synch_data(view, ('folds',))
+
+    def on_hover(self, view, point, hover_zone):
+        self.arm_synch_scroll(view)
 
     # save data on focus lost
     def on_deactivated_async(self, view):
-        global last_focused_view_name
+        global last_focused_view_name, synch_scroll_idle_since
         last_focused_view_name = view.name()+'-'+str(view.file_name())+'-'+str(view.settings().get('is_widget'))
 
+        # the synch scroll stops polling, until the view is activated again
+        if view.id() == focused_view_id:
+            synch_scroll_idle_since = 0
+
         # ST BUG https://github.com/SublimeTextIssues/Core/issues/10
         # unable to flush when the application is closed
         # ST BUG https://github.com/SublimeTextIssues/Core/issues/181
@@ -287,8 +2883,10 @@ class BufferScroll(sublime_plugin.EventListener):
 
     def on_activated_async(self, view):
         """
-            Track the current_view. See next event listener.
+            Track the focused_view. See next event listener.
         """
+        global focused_view_id, focused_view
+
         # global already_restored
         # window = view.window();
 
@@ -298,9 +2896,22 @@ class BufferScroll(sublime_plugin.EventListener):
         # view    = window.active_view()
         view_id = view.id()
 
+        # the main thread may pop it meanwhile, see `restore_idle_tick`
+        if restore_queue.pop(view_id, None) is not None:
+            self.restore(view, 'on_activated')
+
+        clone_registry.add(view)
+        clone_registry.invalidate(view)
+
+        # reading a file without changing it keeps its record from being evicted
+        if view.file_name() and database_loaded:
+            data_base.touch(self.path_id(view.file_name()))
+
         if not view.settings().get('is_widget'):
-            preferences.current_view_id = view_id
-            preferences.synch_scroll_current_view_object = view
+            focused_view_id = view_id
+            focused_view = view
+
+            self.arm_synch_scroll(view)
 
         # if view_id not in already_restored:
         #     self.restore( view, 'on_activated', 'on_activated_async', True)
@@ -323,6 +2934,14 @@ class BufferScroll(sublime_plugin.EventListener):
         """
         self.save(view, 'on_pre_save')
 
+    def on_post_save(self, view):
+        """
+            After a Save As, the record follows the file, see `view_id`.
+        """
+
+        if database_loaded and view.file_name():
+            self.view_id(view)
+
     def on_post_text_command(self, view, command_name, args):
         """
             Typewriter_scrolling
@@ -333,6 +2952,20 @@ class BufferScroll(sublime_plugin.EventListener):
 
             BufferScrollAPI.on_modified(view)
 
+        self.arm_synch_scroll(view)
+
+        if command_name == 'set_file_type':
+            Preferences.forget(view)
+
+        if command_name in synch_data_commands:
+            regions_dirty.add(view.id())
+            kinds = synch_data_commands[command_name]
+
+            if command_name == 'clear_bookmarks' and args and args.get('name') == 'mark':
+                kinds = ('marks',)
+
+            self.synch_data(view, command_name, kinds)
+
     def on_modified(self, view):
         """
         Typewriter scrolling.
@@ -351,32 +2984,58 @@ class BufferScroll(sublime_plugin.EventListener):
         Issue: https://github.com/evandrocoan/SublimeTextStudio/issues/49
         """
 
-        # TODO STBUG if the view is in a column, for some reason the parameter view, is not correct. This fix it
-        if not view.settings().get('is_widget') \
+        global typewriter_armed
+
+        if not typewriter_armed \
+                and not view.settings().get('is_widget') \
                 and not view.is_scratch() \
-                and len(view.sel()) == 1 \
                 and preferences.get('typewriter_scrolling', view):
-            window = view.window();
 
-            if not window:
-                window = sublime.active_window()
+            # a held key or a macro only scrolls once per frame
+            typewriter_armed = True
+            sublime.set_timeout(lambda: self.typewriter_scroll(view), 16)
+
+    def typewriter_scroll(self, view):
+        """
+            Centers the line of the first selection, unless it is still the line centered last
+            time, and the view was not scrolled since.
+        """
+        global typewriter_armed
+        global typewriter_last
 
-            view = window.active_view()
+        typewriter_armed = False
 
-            # log( 2, "" )
-            # log( 2, 'TYPEWRITER_SCROLLING' )
-            line, col = view.rowcol(view.sel()[0].b)
-            line = line-preferences.typewriter_scrolling_shift
+        # TODO STBUG if the view is in a column, for some reason the parameter view, is not correct. This fix it
+        window = view.window();
 
-            if line < 1:
-                line = 0
+        if not window:
+            window = sublime.active_window()
+
+        view = window.active_view()
+
+        if view is None or not len(view.sel()):
+            return
+
+        # log( 2, "" )
+        # log( 2, 'TYPEWRITER_SCROLLING' )
+        line, col = view.rowcol(view.sel()[0].b)
+        line = line-preferences.typewriter_scrolling_shift
+
+        if line < 1:
+            line = 0
 
-            point = view.text_point(line, col)
-            position_prev = view.viewport_position() # save the horizontal scroll
+        position_prev = view.viewport_position() # save the horizontal scroll
 
-            view.show_at_center(point)
-            position_next = view.viewport_position() # restore the horizontal scroll
-            view.set_viewport_position((position_prev[0], position_next[1]))
+        if typewriter_last == (view.id(), line, position_prev):
+            return
+
+        point = view.text_point(line, col)
+
+        view.show_at_center(point)
+        position_next = view.viewport_position() # restore the horizontal scroll
+        view.set_viewport_position((position_prev[0], position_next[1]))
+
+        typewriter_last = (view.id(), line, view.viewport_position())
 
     def save(self, view, where = 'unknow'):
         """
@@ -386,6 +3045,13 @@ class BufferScroll(sublime_plugin.EventListener):
         if view is None or not view.file_name() or view.settings().get('is_widget'):
             return
 
+        # it would save the defaults over the record, as it was not restored yet
+        if view.id() in restore_queue:
+            return
+
+        if not when_loaded(lambda: self.save(view, where)):
+            return
+
         if view.is_loading():
             sublime.set_timeout(lambda: self.save(view, where), 100)
 
@@ -400,91 +3066,199 @@ class BufferScroll(sublime_plugin.EventListener):
             # log( 2, 'position: '+index )
 
             # creates an object for this view, if it is unknow to the package
-            if id not in data_base:
-                data_base[id] = {}
+            if data_base.get(id) is None:
+                data_base[id] = BufferScrollRecord()
 
-            # if the result of the new collected data is different
-            # from the old data, then will write to disk
-            # this will hold the old value for comparation
-            old_db = dict(data_base[id])
+            record = data_base[id]
+            view_id = view.id()
+
+            # the fields which changed, only these are written to disk
+            dirty = set()
 
             # if the size of the view change outside the application skip restoration
             # if not we will restore folds in funny positions, etc...
-            data_base[id]['id'] = int(view.size())
-
-            # scroll
-            if 'l' not in data_base[id]:
-                data_base[id]['l'] = {}
+            if record.size != int(view.size()):
+                record.size = int(view.size())
+                dirty.add('size')
 
             # save the scroll with "index" as the id ( for cloned views )
-            data_base[id]['l'][index] = list(view.viewport_position())
+            position = tuple(view.viewport_position())
+
             # also save as default if no exists
-            if index != '0':
-                data_base[id]['l']['0'] = list(view.viewport_position())
-            # log( 2, 'viewport_position: '+str(data_base[id]['l']['0']) )
+            if record.scroll.get(index) != position or record.scroll.get('0') != position:
+                # the positions are by window id and view index, forget the closed windows ones
+                windows = set(str(window.id()) for window in sublime.windows())
+                scroll = dict((key, value) for key, value in record.scroll.items()
+                        if key == '0' or key.split('(')[0] in windows)
+
+                scroll[index] = position
+                scroll['0'] = position
+
+                record.scroll = scroll
+                dirty.add('scroll')
+            # log( 2, 'viewport_position: '+str(record.scroll['0']) )
 
             # selections
-            data_base[id]['s'] = [[item.a, item.b] for item in view.sel()]
-            # log( 2, 'selections: '+str(data_base[id]['s']) )
+            if record.update('selections', region_array(view.sel())):
+                dirty.add('selections')
+            # log( 2, 'selections: '+str(record['s']) )
+
+            # the other regions move when the text is edited, or change with the commands of
+            # `synch_data_commands`, but also with the fold arrows of the gutter, or other packages,
+            # which send no event, so they are always read when the view loses the focus, as the
+            # application may quit after it without "on_pre_close", and the fingerprints tell
+            # whether they changed
+            change_count = view.change_count()
+
+            if save_change_counts.get(view_id) != change_count \
+                    or view_id in regions_dirty \
+                    or where in ('on_pre_close', 'on_deactivated'):
+
+                save_change_counts[view_id] = change_count
+                regions_dirty.discard(view_id)
 
-            # marks
-            data_base[id]['m'] = [[item.a, item.b] for item in view.get_regions("mark")]
-            # log( 2, 'marks: '+str(data_base[id]['m']) )
+                # marks
+                if record.update('marks', region_array(view.get_regions("mark"))):
+                    dirty.add('marks')
+                # log( 2, 'marks: '+str(record['m']) )
+
+                # bookmarks
+                if record.update('bookmarks', region_array(view.get_regions("bookmarks"))):
+                    dirty.add('bookmarks')
+                # log( 2, 'bookmarks: '+str(record['b']) )
 
-            # bookmarks
-            data_base[id]['b'] = [[item.a, item.b] for item in view.get_regions("bookmarks")]
-            # log( 2, 'bookmarks: '+str(data_base[id]['b']) )
+                # folding
+                folds = record.folds
 
-            # previous folding save, to be able to refold
-            if 'f' in data_base[id] and list(data_base[id]['f']) != []:
-                data_base[id]['pf'] = list(data_base[id]['f'])
+                if record.update('folds', region_array(view.folded_regions())):
+                    dirty.add('folds')
 
-            # folding
-            data_base[id]['f'] = [[item.a, item.b] for item in view.folded_regions()]
-            # log( 2, 'fold: '+str(data_base[id]['f']) )
+                    # previous folding save, to be able to refold
+                    if folds:
+                        record.update('previous_folds', folds)
+                        dirty.add('previous_folds')
+                # log( 2, 'fold: '+str(record['f']) )
 
             # color_scheme http://www.sublimetext.com/forum/viewtopic.php?p=25624#p25624
             if preferences.get('remember_color_scheme', view):
-                data_base[id]['c'] = view.settings().get('color_scheme')
-                # log( 2, 'color_scheme: '+str(data_base[id]['c']) )
+
+                if record.update('color_scheme', view.settings().get('color_scheme')):
+                    dirty.add('color_scheme')
+                # log( 2, 'color_scheme: '+str(record.color_scheme) )
 
             # syntax
             if preferences.get('remember_syntax', view):
-                data_base[id]['x'] = view.settings().get('syntax')
-                # log( 2, 'syntax: '+str(data_base[id]['x']) )
+
+                if record.update('syntax', view.settings().get('syntax')):
+                    dirty.add('syntax')
+                # log( 2, 'syntax: '+str(record.syntax) )
 
             # settings list
-            settings = preferences.get('remember_settings_list', view)
-            data_base[id]['p'] = []
+            settings = []
 
-            for item in settings:
+            for item in preferences.get('remember_settings_list', view):
 
                 if item:
                     value = view.settings().get(item, 'waaaaaa')
 
                     if value != 'waaaaaa':
-                        data_base[id]['p'].append({'k':item, 'v':value})
+                        settings.append((item, value))
+
+            if record.update('settings', settings):
+                dirty.add('settings')
+
+            # to tell the files having the same id apart, see `path_id`
+            if record.update('path', view.file_name()):
+                dirty.add('path')
 
             # write to disk only if something changed
-            if old_db != data_base[id] or where == 'on_deactivated':
+            if dirty:
                 data_base.move_to_end(id)
-                BufferScrollSaveThread().start()
+                save_thread.schedule(id, dirty)
 
     def view_id(self, view):
+        """
+            The id of the view record, from its file path, and its index, see `view_index`.
 
-        if not view.settings().has('buffer_scroll_name'):
-            view.settings().set('buffer_scroll_name', sha1(normpath(str(view.file_name()).encode('utf-8'))).hexdigest()[:8])
+            When the path changed since the last call, as after a rename or a Save As, the record
+            follows the file, see `move_record`.
+        """
+        path = view.file_name()
+        previous = view_paths.get(view.id())
 
-        return (view.settings().get('buffer_scroll_name'), self.view_index(view))
+        if previous != path:
+            view_paths[view.id()] = path
 
-    def view_index(self, view):
-        window = view.window();
+            if previous and path and database_loaded:
+                self.move_record(previous, path)
 
-        if not window:
-            window = sublime.active_window()
+        return (self.path_id(path), self.view_index(view))
 
-        index = window.get_view_index(view)
-        return str(window.id())+str(index)
+    def path_id(self, path):
+        """
+            The record id of the file path, the first 8 hex chars of the sha1 of the path, cached.
+
+            As two paths can have the same hash, the records know their path, and when the record of
+            the id is of another file, the ids of the path followed by `:1`, `:2`, ... are tried,
+            until one is free, or is of this file. The records written before they knew their path
+            are taken by the first file using them.
+        """
+
+        path = str(path)
+
+        if path in path_ids:
+            return path_ids[path]
+
+        id = sha1(normpath(path.encode('utf-8'))).hexdigest()[:8]
+
+        # without the records, the collisions are not known yet
+        if not database_loaded:
+            return id
+
+        for attempt in range(1, 100):
+            record = data_base.get(id)
+
+            if record is None or record.path is None or normpath(record.path) == normpath(path):
+                break
+
+            print('BufferScroll: %s and %s have the same id %s' % (path, record.path, id))
+            profiler.count('id_collisions')
+
+            id = sha1(normpath((path+':'+str(attempt)).encode('utf-8'))).hexdigest()[:8]
+
+        path_ids[path] = id
+        return id
+
+    def move_record(self, previous, path):
+        """
+            Gives the record of the `previous` path to the new one, after a rename, or a copy of it
+            after a Save As, when the previous file is still there.
+        """
+        previous_id = self.path_id(previous)
+        id = self.path_id(path)
+
+        if previous_id == id:
+            return
+
+        record = data_base.get(previous_id)
+
+        if record is None:
+            return
+
+        record = record.copy()
+        record.path = path
+        record.fingerprints.pop('path', None)
+
+        data_base[id] = record
+        save_thread.schedule(id, BufferScrollRecord.fields)
+
+        if not lexists(previous):
+            del data_base[previous_id]
+            path_ids.pop(previous, None)
+            save_thread.schedule(previous_id, ())
+
+    def view_index(self, view):
+        return clone_registry.index(view)
 
     def restore_scrolling(self, view, where = 'unknow'):
         global scroll_already_restored
@@ -502,6 +3276,9 @@ class BufferScroll(sublime_plugin.EventListener):
 
             return
 
+        if not when_loaded(lambda: self.restore_scrolling(view, where)):
+            return
+
         if view.is_loading():
             sublime.set_timeout(lambda: self.restore_scrolling(view, where), 100)
 
@@ -523,16 +3300,17 @@ class BufferScroll(sublime_plugin.EventListener):
                 # log( 2, 'id: '+id )
                 # log( 2, 'position: '+index )
 
-                if id in data_base and preferences.get('restore_scroll', view):
+                if preferences.get('restore_scroll', view) and data_base.get(id) is not None:
+                    record = data_base[id]
 
                     # log( 2, 'DOING...' )
                     # scroll
-                    if preferences.get('i_use_cloned_views', view) and index in data_base[id]['l']:
-                        position = tuple(data_base[id]['l'][index])
+                    if preferences.get('i_use_cloned_views', view) and index in record.scroll:
+                        position = tuple(record.scroll[index])
                         view.set_viewport_position(position, preferences.use_animations)
 
                     else:
-                        position = tuple(data_base[id]['l']['0'])
+                        position = tuple(record.scroll['0'])
                         view.set_viewport_position(position, preferences.use_animations)
 
                     # ugly hack
@@ -589,12 +3367,16 @@ class BufferScroll(sublime_plugin.EventListener):
 
             return
 
+        if not when_loaded(lambda: self.restore(view, where, isOnActaved)):
+            return
+
         if view.is_loading():
             sublime.set_timeout(lambda: self.restore(view, where), 100)
 
         else:
             already_restored[view.id()] = True
             id, index = self.view_id(view)
+            data_base.touch(id)
 
             # log( 2, "" )
             # log( 2, 'RESTORE()' )
@@ -604,17 +3386,15 @@ class BufferScroll(sublime_plugin.EventListener):
             # log( 2, 'id: '+id )
             # log( 2, 'position: '+index )
 
-            if id in data_base:
+            if data_base.get(id) is not None:
                 # log( 2, 'DOING...' )
+                record = data_base[id]
                 isClonedView = False
 
                 # if the view changed outside of the application, don't restore folds etc
-                if data_base[id]['id'] == int(view.size()):
+                if record.size == int(view.size()):
                     # fold
-                    rs = []
-
-                    for r in data_base[id]['f']:
-                        rs.append(sublime.Region(int(r[0]), int(r[1])))
+                    rs = region_list(record.folds)
 
                     if len(rs):
                         view.fold(rs)
@@ -624,60 +3404,52 @@ class BufferScroll(sublime_plugin.EventListener):
                     isClonedView = is_cloned_view( view )
 
                     # selection
-                    if ( len(data_base[id]['s']) > 0 and not isClonedView ) or g_isToAllowSelectOperationOnTheClonedView:
+                    if ( len(record.selections) > 0 and not isClonedView ) or g_isToAllowSelectOperationOnTheClonedView:
                         view.sel().clear()
-                        for r in data_base[id]['s']:
-                            view.sel().add(sublime.Region(int(r[0]), int(r[1])))
-                        # log( 2, 'selection: '+str(data_base[id]['s'])) ;
+                        for r in region_list(record.selections):
+                            view.sel().add(r)
+                        # log( 2, 'selection: '+str(record['s'])) ;
 
                     # marks
-                    rs = []
-
-                    for r in data_base[id]['m']:
-                        rs.append(sublime.Region(int(r[0]), int(r[1])))
+                    rs = region_list(record.marks)
 
                     if len(rs):
                         view.add_regions("mark", rs, "mark", "dot", sublime.HIDDEN | sublime.PERSISTENT)
-                        # log( 2, 'marks: '+str(data_base[id]['m'])) ;
+                        # log( 2, 'marks: '+str(record['m'])) ;
 
                     # bookmarks
-                    rs = []
-
-                    for r in data_base[id]['b']:
-                        rs.append(sublime.Region(int(r[0]), int(r[1])))
+                    rs = region_list(record.bookmarks)
 
                     if len(rs):
                         view.add_regions("bookmarks", rs, "bookmarks", "bookmark", sublime.HIDDEN | sublime.PERSISTENT)
-                        # log( 2, 'bookmarks: '+str(data_base[id]['b'])) ;
+                        # log( 2, 'bookmarks: '+str(record['b'])) ;
 
                 # color scheme
-                if preferences.get('remember_color_scheme', view) and 'c' in data_base[id] and view.settings().get('color_scheme') != data_base[id]['c']:
-                    view.settings().set('color_scheme', data_base[id]['c'])
-                    # log( 2, 'color scheme: '+str(data_base[id]['c'])) ;
+                if preferences.get('remember_color_scheme', view) and record.color_scheme is not None and view.settings().get('color_scheme') != record.color_scheme:
+                    view.settings().set('color_scheme', record.color_scheme)
+                    # log( 2, 'color scheme: '+str(record.color_scheme)) ;
 
                 # syntax
-                if preferences.get('remember_syntax', view) and 'x' in data_base[id] and view.settings().get('syntax') != data_base[id]['x'] and lexists(dirname(sublime.packages_path())+'/'+data_base[id]['x']):
+                if preferences.get('remember_syntax', view) and record.syntax is not None and view.settings().get('syntax') != record.syntax and lexists(dirname(sublime.packages_path())+'/'+record.syntax):
 
-                    view.settings().set('syntax', data_base[id]['x'])
-                    # log( 2, 'syntax: '+str(data_base[id]['x'])) ;
+                    view.settings().set('syntax', record.syntax)
+                    # log( 2, 'syntax: '+str(record.syntax)) ;
 
-                if 'p' in data_base[id]:
+                if record.settings:
+                    settings = dict(record.settings)
 
                     for item in preferences.get('remember_settings_list', view):
 
-                        for i in data_base[id]['p']:
-
-                            if 'k' in i and i['k'] == item:
-                                view.settings().set(i['k'], i['v'])
-                                break
+                        if item in settings:
+                            view.settings().set(item, settings[item])
 
                 # scroll
-                if preferences.get('restore_scroll', view) and preferences.get('i_use_cloned_views', view) and index in data_base[id]['l']:
-                    position = tuple(data_base[id]['l'][index])
+                if preferences.get('restore_scroll', view) and preferences.get('i_use_cloned_views', view) and index in record.scroll:
+                    position = tuple(record.scroll[index])
                     view.set_viewport_position(position, preferences.use_animations)
 
                 elif preferences.get('restore_scroll', view):
-                    position = tuple(data_base[id]['l']['0'])
+                    position = tuple(record.scroll['0'])
                     view.set_viewport_position(position, preferences.use_animations)
 
                 # There is not need to an expensive and slow if, when just setting it to false is faster.
@@ -690,6 +3462,62 @@ class BufferScroll(sublime_plugin.EventListener):
                 # log( 2, 'SKIPPED...' )
                 pass
 
+    def is_visible(self, view):
+        """
+            Returns False when the view is a background tab of its group.
+        """
+        window = view.window()
+
+        if not window:
+            return True
+
+        group, index = window.get_view_index(view)
+        return group < 0 or window.active_view_in_group(group) == view
+
+    def queue_restore(self, view):
+        """
+            Restores the background tab when it is activated, or when the application is idle,
+            so opening a project with many tabs only restores the visible ones right away.
+        """
+        global restore_idle_armed
+
+        restore_queue[view.id()] = view
+
+        if not restore_idle_armed:
+            restore_idle_armed = True
+            sublime.set_timeout(self.restore_idle_tick, preferences.lazy_restore_interval)
+
+    def restore_idle_tick(self):
+        """
+            Restores the queued tabs until `lazy_restore_budget` milliseconds are spent, then waits
+            `lazy_restore_interval` milliseconds to continue, so the application stays responsive.
+        """
+        global restore_idle_armed
+
+        start = time.perf_counter()
+        loading = []
+
+        while restore_queue and time.perf_counter()-start < preferences.lazy_restore_budget / 1000.0:
+            view_id, view = restore_queue.popitem(last = False)
+
+            if view.window() is None:
+                continue
+
+            if view.is_loading():
+                loading.append((view_id, view))
+
+            # something else, as a `goto` command, already moved the caret
+            elif self._scroll_restoring_allowed(view):
+                self.restore(view, 'on_idle')
+
+        restore_queue.update(loading)
+
+        if restore_queue:
+            sublime.set_timeout(self.restore_idle_tick, preferences.lazy_restore_interval)
+
+        else:
+            restore_idle_armed = False
+
     def stupid_scroll(self, view, position):
         view.set_viewport_position(position, preferences.use_animations)
 
@@ -697,70 +3525,60 @@ class BufferScroll(sublime_plugin.EventListener):
         # log( 2, 'current scroll for: '+str(view.file_name())) ;
         # log( 2, 'current scroll: '+str(view.viewport_position())) ;
 
-    def synch_data(self, view = None, where = 'unknow'):
+    def synch_data(self, view = None, where = 'unknow', kinds = ('bookmarks', 'marks', 'folds')):
+        """
+            Copies the bookmarks, marks or folds of the view to its clones. Only the kinds of
+            regions which may have changed are given, see `synch_data_commands`.
+        """
         if view is None:
-            view = preferences.synch_scroll_current_view_object
+            view = focused_view
 
-        if view is None or view.settings().get('is_widget'):
+        if view is None or view.settings().get('is_widget') or not database_loaded:
             return
 
         # if there is something to synch
-        if not preferences.get('synch_bookmarks', view) and not preferences.get('synch_marks', view) and not preferences.get('synch_folds', view):
-            return
+        kinds = [kind for kind in kinds if preferences.get('synch_'+kind, view)]
 
-        preferences.synch_data_running = True
+        if not kinds:
+            return
 
         if view.is_loading():
-            preferences.synch_data_running = False
-            sublime.set_timeout(lambda: self.synch_data(view, where), 200)
+            sublime.set_timeout(lambda: self.synch_data(view, where, kinds), 200)
 
         else:
-            self.save(view, 'synch')
-
             # if there is clones
-            clones = []
-
-            for window in sublime.windows():
-
-                for _view in window.views():
-
-                    if _view.buffer_id() == view.buffer_id() and view.id() != _view.id():
-                        clones.append(_view)
+            clones = self.clones(view)
 
             if not clones:
-                preferences.synch_data_running = False
                 return
 
             # log( 2, "" )
             # log( 2, 'SYNCH_DATA()' )
-            id, index = self.view_id(view)
-
-            if preferences.get('synch_bookmarks', view):
-                bookmarks = []
-
-                for r in data_base[id]['b']:
-                    bookmarks.append(sublime.Region(int(r[0]), int(r[1])))
-
-            if preferences.get('synch_marks', view):
-                marks = []
+            if 'bookmarks' in kinds:
+                bookmarks = view.get_regions('bookmarks')
+                bookmarks_views = self.region_version(view, 'bookmarks', bookmarks)
 
-                for r in data_base[id]['m']:
-                    marks.append(sublime.Region(int(r[0]), int(r[1])))
+            if 'marks' in kinds:
+                marks = view.get_regions('mark')
+                marks_views = self.region_version(view, 'marks', marks)
 
-            if preferences.get('synch_folds', view):
-                folds = []
-
-                for r in data_base[id]['f']:
-                    folds.append(sublime.Region(int(r[0]), int(r[1])))
+            if 'folds' in kinds:
+                folds = view.folded_regions()
+                folds_views = self.region_version(view, 'folds', folds)
+                fold_points = None
 
             for _view in clones:
                 # bookmarks
-                if preferences.get('synch_bookmarks', _view):
+                if 'bookmarks' in kinds \
+                        and _view.id() not in bookmarks_views \
+                        and preferences.get('synch_bookmarks', _view):
+
+                    bookmarks_views.add(_view.id())
 
                     if bookmarks:
 
+                        # add_regions replaces them all, so it only runs when something differs
                         if bookmarks != _view.get_regions('bookmarks'):
-                            _view.erase_regions("bookmarks")
                             # log( 2, 'synching bookmarks' )
                             _view.add_regions("bookmarks", bookmarks, "bookmarks", "bookmark", sublime.HIDDEN | sublime.PERSISTENT)
 
@@ -772,12 +3590,15 @@ class BufferScroll(sublime_plugin.EventListener):
                         _view.erase_regions("bookmarks")
 
                 # marks
-                if preferences.get('synch_marks', _view):
+                if 'marks' in kinds \
+                        and _view.id() not in marks_views \
+                        and preferences.get('synch_marks', _view):
+
+                    marks_views.add(_view.id())
 
                     if marks:
 
                         if marks != _view.get_regions('mark'):
-                            _view.erase_regions("mark")
                             # log( 2, 'synching marks' )
                             _view.add_regions("mark", marks, "mark", "dot", sublime.HIDDEN | sublime.PERSISTENT)
 
@@ -789,115 +3610,222 @@ class BufferScroll(sublime_plugin.EventListener):
                         _view.erase_regions("mark")
 
                 # folds
-                if preferences.get('synch_folds', _view):
+                if 'folds' in kinds \
+                        and _view.id() not in folds_views \
+                        and preferences.get('synch_folds', _view):
 
-                    if folds:
+                    folds_views.add(_view.id())
 
-                        if folds != _view.folded_regions():
-                            # log( 2, 'synching folds' )
-                            _view.unfold(sublime.Region(0, _view.size()))
-                            _view.fold(folds)
+                    if fold_points is None:
+                        fold_points = set((region.a, region.b) for region in folds)
 
-                        else:
-                            # log( 2, 'skipping synch of folds these are equal' )
-                            pass
+                    self.synch_folds(_view, folds, fold_points)
 
-                    else:
-                        _view.unfold(sublime.Region(0, _view.size()))
+    def region_version(self, view, kind, regions):
+        """
+            The ids of the views of the view buffer known to have these `regions` of the `kind`,
+            the view included, so the clones already having them are not read and compared again.
 
-        preferences.synch_data_running = False
+            The version of the regions is their hash, and a view is added once it was synched.
+        """
+        key = (view.buffer_id(), kind)
+        version = hash(region_array(regions).tobytes())
 
-    def synch_scroll(self):
-        preferences.synch_scroll_running = True
+        if key not in region_versions or region_versions[key][0] != version:
+            region_versions[key] = (version, set())
 
-        # find current view
-        view = preferences.synch_scroll_current_view_object
-        if view is None or view.is_loading() or not preferences.get('synch_scroll', view):
-            preferences.synch_scroll_running = False
+        views = region_versions[key][1]
+        views.add(view.id())
+        return views
+
+    def synch_folds(self, view, folds, fold_points):
+        """
+            Folds the view as `folds`, whose points are in the set `fold_points`, unfolding and
+            folding only the regions which differ, as each of them lays out the text again.
+        """
+        folded = view.folded_regions()
+        unfold = [region for region in folded if (region.a, region.b) not in fold_points]
+
+        if unfold:
+            # log( 2, 'unfolding', len(unfold) )
+            view.unfold(unfold)
+
+            # unfolding may take some neighbours along
+            folded = view.folded_regions()
+
+        folded_points = set((region.a, region.b) for region in folded)
+        fold = [region for region in folds if (region.a, region.b) not in folded_points]
+
+        if fold:
+            # log( 2, 'folding', len(fold) )
+            view.fold(fold)
+
+    def schedule_synch_data(self, view, kinds):
+        """
+            Edits can unfold regions, and come one keystroke at a time, so they are synched
+            together, once no edit came for 500 milliseconds. Each call counts, and only the
+            timeout of the last one synchs.
+        """
+        view_id = view.id()
+
+        pending = synch_data_pending.setdefault(view_id, [set(), 0])
+        pending[0].update(kinds)
+        pending[1] += 1
+
+        version = pending[1]
+
+        def synch():
+
+            if view_id in synch_data_pending and synch_data_pending[view_id][1] == version:
+                self.synch_data(view, 'on_modified', synch_data_pending.pop(view_id)[0])
+
+        sublime.set_timeout(synch, 500)
+
+    def arm_synch_scroll(self, view):
+        """
+            Starts following the scroll of the current view, when it has clones to keep in synch.
+
+            As there is no scroll event, the viewport is polled quickly after something happened,
+            and once it did not move for `synch_scroll_idle_timeout` milliseconds, only every
+            `synch_scroll_idle_interval` milliseconds, as scrolling with the mouse wheel or the
+            scroll bar sends no event at all. It stops when there is nothing to synch, when the view
+            loses the focus, or once it did not move for `synch_scroll_idle_limit` milliseconds,
+            until the next event.
+        """
+        global synch_scroll_armed
+        global synch_scroll_idle_since
+
+        if synch_scroll_armed:
+            synch_scroll_idle_since = time.time()
             return
 
-        # if something changed
-        if preferences.synch_scroll_last_view_id != preferences.current_view_id:
-            preferences.synch_scroll_last_view_id = preferences.current_view_id
-            preferences.synch_scroll_last_view_position = 0
+        if view is None or view.settings().get('is_widget'):
+            return
 
-        last_view_position = str([view.visible_region(), view.viewport_position(), view.viewport_extent()])
+        if view.id() not in scroll_links \
+                and (not preferences.get('synch_scroll', view) or not self.clones(view)):
 
-        if preferences.synch_scroll_last_view_position == last_view_position:
-            preferences.synch_scroll_running = False
             return
 
-        preferences.synch_scroll_last_view_position = last_view_position
+        synch_scroll_armed = True
+        synch_scroll_idle_since = time.time()
+        sublime.set_timeout(self.synch_scroll_tick, 80)
 
-        # if there is clones
-        clones = {}
-        clones_positions = []
+    def synch_scroll_tick(self):
+        global synch_scroll_armed
+        global synch_scroll_idle_since
 
-        for window in sublime.windows():
+        moved = self.synch_scroll()
+        idle = time.time()-synch_scroll_idle_since
 
-            for _view in window.views():
+        if moved:
+            synch_scroll_idle_since = time.time()
 
-                if not _view.is_loading() and _view.buffer_id() == view.buffer_id() and view.id() != _view.id():
-                    id, index = self.view_id(_view)
-                    clones[index] = _view
-                    clones_positions.append(index)
+        elif moved is None or not preferences.synch_scroll_idle_interval or not synch_scroll_idle_since \
+                or (preferences.synch_scroll_idle_limit and idle > preferences.synch_scroll_idle_limit / 1000.0):
 
-        if not clones_positions:
-            preferences.synch_scroll_running = False
+            synch_scroll_armed = False
             return
 
-        # log( 2, "" )
-        # log( 2, 'SYNCH_SCROLL()' )
+        elif idle > preferences.synch_scroll_idle_timeout / 1000.0:
+            sublime.set_timeout(self.synch_scroll_tick, preferences.synch_scroll_idle_interval)
+            return
 
-        # current view
-        id, index = self.view_id(view)
+        sublime.set_timeout(self.synch_scroll_tick, 80)
 
-        # append current view to list of clones
-        clones[index] = view
-        clones_positions.append(index)
-        clones_positions.sort()
+    def clones(self, view):
+        return clone_registry.siblings(view)
 
-        # find current view index
-        i = [i for i,x in enumerate(clones_positions) if x == index][0]
+    def synch_scroll(self):
+        """
+            Scrolls the clones of the current view along with it. Returns None when there is
+            nothing to synch, otherwise whether the current view moved since the last call.
+        """
+
+        # find current view
+        view = focused_view
+        if view is None or view.is_loading():
+            return None
+
+        synch_scroll = preferences.get('synch_scroll', view)
+
+        if not synch_scroll and view.id() not in scroll_links:
+            return None
+
+        # if something changed
+        global synch_scroll_last_view_id, synch_scroll_last_view_position
+
+        if synch_scroll_last_view_id != focused_view_id:
+            synch_scroll_last_view_id = focused_view_id
+            synch_scroll_last_view_position = 0
+
+        extent = view.viewport_extent()
+        plan = clone_registry.plan(view, extent) if synch_scroll else None
+
+        # the clones may be gone since the view last moved
+        if plan is None and view.id() not in scroll_links:
+            return None
 
-        lenght = len(clones_positions)
-        line     = view.line_height()
+        last_view_position = str([view.visible_region(), view.viewport_position(), extent])
+
+        if synch_scroll_last_view_position == last_view_position:
+            return False
+
+        synch_scroll_last_view_position = last_view_position
+
+        linked = None
+
+        if view.id() in scroll_links:
+            linked = scroll_links[view.id()].synch(view)
+
+        if plan is None:
+            return linked
+
+        # log( 2, "" )
+        # log( 2, 'SYNCH_SCROLL()' )
+
+        # find current view index
+        i = plan.views.index(view)
+        change_count = view.change_count()
 
         # synch scroll for views to the left
-        b = i-1
         previous_view = view
 
-        while b > -1:
-            current_view = clones[clones_positions[b]]
-            ppl, ppt = current_view.text_to_layout(previous_view.line(previous_view.visible_region().a).b)
-            cpw, cph = current_view.viewport_extent()
-            left, old_top = current_view.viewport_position()
-            top = ((ppt-cph)+line)
+        for current_view in reversed(plan.views[:i]):
+            target = previous_view.line(previous_view.visible_region().a).b
+
+            if plan.moved(current_view, target, change_count):
+                ppl, ppt = current_view.text_to_layout(target)
+                cpw, cph = plan.extents[current_view.id()]
+                line = plan.heights[current_view.id()]
+                left, old_top = current_view.viewport_position()
+                top = ((ppt-cph)+line)
+
+                if abs(old_top-top) >= line:
+                    current_view.set_viewport_position((left, top), preferences.use_animations)
 
-            if abs(old_top-top) >= line:
-                current_view.set_viewport_position((left, top), preferences.use_animations)
             previous_view = current_view
-            b -= 1
 
         # synch scroll for views to the right
-        i += 1
         previous_view = view
 
-        while i < lenght:
-            current_view = clones[clones_positions[i]]
-            top = current_view.text_to_layout(previous_view.line(previous_view.visible_region().b).a)
-            left, old_top = current_view.viewport_position()
+        for current_view in plan.views[i+1:]:
+            target = previous_view.line(previous_view.visible_region().b).a
 
-            # 3 is the approximated height of the shadow of the tabbar. Removing the shadow Makes the text more readable
-            top = top[1]-3
+            if plan.moved(current_view, target, change_count):
+                top = current_view.text_to_layout(target)
+                line = plan.heights[current_view.id()]
+                left, old_top = current_view.viewport_position()
 
-            if abs(old_top-top) >= line:
-                current_view.set_viewport_position((left, top), preferences.use_animations)
+                # 3 is the approximated height of the shadow of the tabbar. Removing the shadow Makes the text more readable
+                top = top[1]-3
+
+                if abs(old_top-top) >= line:
+                    current_view.set_viewport_position((left, top), preferences.use_animations)
 
             previous_view = current_view
-            i += 1
 
-        preferences.synch_scroll_running = False
+        return True
 
 class BufferScrollForget(sublime_plugin.ApplicationCommand):
 
@@ -906,24 +3834,268 @@ class BufferScrollForget(sublime_plugin.ApplicationCommand):
         if what == 'color_scheme':
             sublime.active_window().active_view().settings().erase('color_scheme')
 
+class BufferScrollBenchmark(sublime_plugin.ApplicationCommand):
+    """
+        Measures parts of the package with synthetic data, and prints the results on the console.
+    """
+
+    def run(self, what = 'regions'):
+        getattr(self, 'benchmark_'+what)()
+        sublime.active_window().run_command('show_panel', {'panel': 'console'})
+
+    def timed(self, function, repeat = 5):
+        """
+            Returns the best time of the runs, in milliseconds.
+        """
+        best = None
+
+        for i in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = (time.perf_counter()-start)*1000
+
+            if best is None or elapsed < best:
+                best = elapsed
+
+        return best
+
+    def benchmark_regions(self):
+        """
+            Compares the pickled lists of `[a, b]` regions, as the database stored them, with
+            `encode_regions`, both compressed.
+        """
+        from random import Random
+
+        random = Random(0)
+        cases = OrderedDict()
+
+        start = 0
+        folds = []
+
+        for i in range(10000):
+            start += random.randint(2, 400)
+            folds.append((start, start+random.randint(1, 300)))
+            start = folds[-1][1]
+
+        cases['10k folds'] = folds
+        cases['10k selections'] = sorted((point, point+random.randint(0, 20))
+                for point in random.sample(range(10000000), 10000))
+        cases['10k column cursors'] = [(line*81+40, line*81+40) for line in range(10000)]
+        cases['10k column selections'] = [(line*81+10, line*81+30) for line in range(10000)]
+
+        print('BufferScroll region encoding, sizes in bytes, times in ms:')
+        print('    %-24s %10s %10s %10s %10s %10s %10s' % ('', 'pickle', 'encode', 'decode',
+                'binary', 'encode', 'decode'))
+
+        for name, regions in cases.items():
+            lists = [[a, b] for a, b in regions]
+            points = array('q', [point for region in regions for point in region])
+
+            pickled = zlib.compress(dumps(lists, -1))
+            encoded = zlib.compress(encode_regions(points))
+
+            if decode_regions(zlib.decompress(encoded)) != points:
+                print('    %-24s did not round trip' % name)
+                continue
+
+            print('    %-24s %10d %10.2f %10.2f %10d %10.2f %10.2f' % (name,
+                    len(pickled),
+                    self.timed(lambda: zlib.compress(dumps(lists, -1))),
+                    self.timed(lambda: loads(zlib.decompress(pickled))),
+                    len(encoded),
+                    self.timed(lambda: zlib.compress(encode_regions(points))),
+                    self.timed(lambda: decode_regions(zlib.decompress(encoded)))))
+
+    def benchmark_codecs(self):
+        """
+            Compresses the records of the database with each codec, as the save thread would.
+        """
+
+        if not database_loaded:
+            print('BufferScroll: the database is still loading')
+            return
+
+        states = [decompress(payload) for payload in data_base.payloads()]
+
+        print('BufferScroll compression of %d records, %d bytes uncompressed, times in ms:' % (len(states),
+                sum(len(state) for state in states)))
+        print('    %-6s %6s %10s %10s %10s' % ('', 'level', 'bytes', 'compress', 'decompress'))
+
+        for codec, level in (('none', 0), ('zlib', 1), ('zlib', 6), ('zlib', 9), ('bz2', 9), ('lzma', 0), ('lzma', 6)):
+
+            if compression_available(codec) != codec:
+                continue
+
+            compressed = [compress(state, codec, level) for state in states]
+
+            print('    %-6s %6d %10d %10.2f %10.2f' % (codec, level,
+                    sum(len(payload) for payload in compressed),
+                    self.timed(lambda: [compress(state, codec, level) for state in states], 3),
+                    self.timed(lambda: [decompress(payload) for payload in compressed], 3)))
+
+    def benchmark_records(self):
+        """
+            Compares writing and reading the records of the database as the pickled dictionaries of
+            `[a, b]` lists the `BufferScroll.bin.gz` had, which were used as they were unpickled, and
+            in their binary format, both compressed with zlib.
+        """
+
+        if not database_loaded:
+            print('BufferScroll: the database is still loading')
+            return
+
+        records = [unpack_record(payload) for payload in data_base.payloads()]
+
+        pickled = [zlib.compress(dumps(record.to_dict(), -1)) for record in records]
+        encoded = [zlib.compress(record.encode()) for record in records]
+
+        print('BufferScroll records, %d of them, sizes in bytes, times in ms:' % len(records))
+        print('    %-8s %10s %10s %10s' % ('', 'bytes', 'write', 'read'))
+
+        print('    %-8s %10d %10.2f %10.2f' % ('pickle', sum(len(payload) for payload in pickled),
+                self.timed(lambda: [zlib.compress(dumps(record.to_dict(), -1)) for record in records]),
+                self.timed(lambda: [loads(zlib.decompress(payload)) for payload in pickled])))
+
+        print('    %-8s %10d %10.2f %10.2f' % ('binary', sum(len(payload) for payload in encoded),
+                self.timed(lambda: [zlib.compress(record.encode()) for record in records]),
+                self.timed(lambda: [BufferScrollRecord.decode(zlib.decompress(payload)) for payload in encoded])))
+
+    def benchmark_alignment(self, lines = 100000, edits = 500):
+        """
+            Aligns a file with a revision of it having some lines added, removed and changed, and
+            maps all its lines.
+        """
+        import random
+
+        chance = random.Random(0)
+        a = ['    line %d %s' % (i, chance.choice(('foo()', 'bar += 1', 'return x'))) if i % 7 else '}' for i in range(lines)]
+        b = list(a)
+
+        for i in range(edits):
+            line = chance.randrange(len(b))
+            kind = chance.random()
+
+            if kind < 0.3:
+                del b[line:line+chance.randrange(1, 20)]
+
+            elif kind < 0.6:
+                b[line:line] = ['added %d %d' % (i, j) for j in range(chance.randrange(1, 20))]
+
+            else:
+                b[line] = 'changed %d' % i
+
+        blocks = aligned_blocks(a, b)
+        table = alignment_table(blocks, len(a), len(b))
+
+        print('BufferScroll alignment of %d and %d lines, %d blocks of %d equal lines, times in ms:' % (len(a),
+                len(b), len(blocks), sum(block[2] for block in blocks)))
+        print('    %-20s %10.2f' % ('diff', self.timed(lambda: aligned_blocks(a, b), 3)))
+        print('    %-20s %10.2f' % ('map every line', self.timed(lambda: [aligned_line(table, 0, line) for line in range(len(a))], 3)))
+
+class BufferScrollLinkViews(sublime_plugin.WindowCommand):
+    """
+        Scrolls the active view with the active view of the next group, as two revisions of a file,
+        keeping their equal lines aligned. Running it again on any of them unlinks them.
+    """
+
+    def run(self):
+        view = self.window.active_view()
+
+        if view is None:
+            return
+
+        if unlink_view(view) is not None:
+            sublime.status_message('BufferScroll: the views scroll on their own again')
+            return
+
+        group = self.window.active_group()
+        other = self.window.active_view_in_group((group+1) % self.window.num_groups())
+
+        if other is None or other.id() == view.id():
+            sublime.status_message('BufferScroll: open the other file on another group to link their scrolling')
+            return
+
+        link_views(view, other)
+        BufferScrollAPI.arm_synch_scroll(view)
+        sublime.status_message('BufferScroll: the views scroll together')
+
+    def is_checked(self):
+        view = self.window.active_view()
+        return view is not None and view.id() in scroll_links
+
+class BufferScrollStartupTimings(sublime_plugin.ApplicationCommand):
+    """
+        Shows on the console how long each startup step took.
+    """
+
+    def run(self):
+        print('BufferScroll startup timings:')
+
+        for name, value in startup_timings.items():
+
+            if isinstance(value, int):
+                print('    %-20s %d' % (name, value))
+
+            else:
+                print('    %-20s %.2f ms' % (name, value*1000))
+
+        sublime.active_window().run_command('show_panel', {'panel': 'console'})
+
+class BufferScrollStats(sublime_plugin.ApplicationCommand):
+    """
+        Shows on the console how long the event handlers and the database operations took, while
+        the `profiling` setting was on, and how much was written to disk.
+    """
+
+    def run(self, reset = False):
+
+        if reset:
+            profiler.reset()
+            print('BufferScroll stats were reset')
+            return
+
+        print('BufferScroll stats, times in ms:')
+
+        if not profiler.enabled:
+            print('    set "profiling": true on BufferScroll.sublime-settings to time the handlers')
+
+        print('    %-28s %8s %10s %10s %10s %10s' % ('', 'calls', 'p50', 'p95', 'max', 'total'))
+
+        for name, histogram in sorted(profiler.histograms.items()):
+            print('    %-28s %8d %10.3f %10.3f %10.3f %10.1f' % (name, histogram.count,
+                    histogram.percentile(0.5)*1000, histogram.percentile(0.95)*1000,
+                    histogram.max*1000, histogram.total*1000))
+
+        print('')
+
+        for name in ('flushes', 'records_written', 'bytes_written', 'compactions', 'merges', 'corrupt_records',
+                'id_collisions'):
+            print('    %-20s %d' % (name, profiler.counters[name]))
+
+        if database_loaded:
+            print('    %-20s %d' % ('records', len(data_base)))
+            print('    %-20s %d' % ('cached_records', len(data_base.cache)))
+            print('    %-20s %d' % ('memory_estimate', data_base.memory()))
+
+        sublime.active_window().run_command('show_panel', {'panel': 'console'})
+
 class BufferScrollReFold(sublime_plugin.WindowCommand):
 
     def run(self):
         view = sublime.active_window().active_view()
 
-        if view is not None:
+        if view is not None and database_loaded:
             id, index = BufferScrollAPI.view_id(view)
 
-            if id in data_base:
+            if data_base.get(id) is not None:
 
-                if 'pf' in data_base[id]:
-                    rs = []
-
-                    for r in data_base[id]['pf']:
-                        rs.append(sublime.Region(int(r[0]), int(r[1])))
+                if data_base[id].previous_folds:
+                    rs = region_list(data_base[id].previous_folds)
 
                     if len(rs):
                         view.fold(rs)
+                        regions_dirty.add(view.id())
+                        BufferScrollAPI.synch_data(view, 'refold', ('folds',))
 
                     # update the minimap
                     position = view.viewport_position()
@@ -933,12 +4105,13 @@ class BufferScrollReFold(sublime_plugin.WindowCommand):
     def is_enabled(self):
         view = sublime.active_window().active_view()
 
-        if view is not None and view.file_name():
-            id, index = BufferScrollAPI.view_id(view)
+        # asked by the menus, so a renamed file record is moved by `save` or `restore`, not here
+        if view is not None and view.file_name() and database_loaded:
+            id = BufferScrollAPI.path_id(view.file_name())
 
-            if id in data_base:
+            if data_base.get(id) is not None:
 
-                if 'pf' in data_base[id] and len(data_base[id]['pf']):
+                if len(data_base[id].previous_folds):
                     return True
 
         return False
@@ -977,27 +4150,6 @@ class BufferScrollFoldSelectUnfolded(sublime_plugin.WindowCommand):
 
             view.sel().add(sublime.Region(prev, view.size()))
 
-def synch_scroll_loop():
-    synch_scroll = BufferScrollAPI.synch_scroll
-
-    while True:
-
-        if not preferences.synch_scroll_running:
-            preferences.synch_scroll_running = True
-            sublime.set_timeout(lambda:synch_scroll(), 0)
-
-        time.sleep(0.08)
-
-def synch_data_loop():
-    synch_data = BufferScrollAPI.synch_data
-
-    while True:
-
-        if not preferences.synch_data_running:
-            sublime.set_timeout(lambda:synch_data(None, 'thread'), 0)
-
-        time.sleep(0.5)
-
 def unlockTheScrollRestoring():
     global disable_scroll_restoring
 
@@ -0,0 +1,294 @@
+"""
+    Replays editing scenarios against the package event handlers, outside of the application,
+    and prints the latency percentiles of each handler.
+
+        python benchmarks/run.py [scenario ...]
+
+    The `sublime` and `sublime_plugin` modules are the stand-ins next to this file, see
+    `sublime.py`. Without arguments, every scenario runs.
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sublime
+import BufferScroll
+
+timings = {}
+
+
+def measure(name, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    timings.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+def percentile(values, fraction):
+    return values[int(round(fraction * (len(values) - 1)))]
+
+def report(scenario):
+    print('%s:' % scenario)
+    print('    %-32s %8s %10s %10s %10s %10s' % ('handler', 'calls', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+
+    for name in sorted(timings):
+        values = sorted(timings[name])
+        print('    %-32s %8d %10.3f %10.3f %10.3f %10.3f' % (name, len(values),
+                percentile(values, 0.5) * 1000, percentile(values, 0.95) * 1000,
+                percentile(values, 0.99) * 1000, values[-1] * 1000))
+
+    print('')
+    timings.clear()
+
+def start(settings):
+    """
+        Loads the package, as the application would, with the given settings.
+    """
+    sublime.reset()
+    sublime.load_settings('BufferScroll.sublime-settings').update(settings)
+
+    window = sublime.Window()
+    measure('plugin_loaded', BufferScroll.plugin_loaded)
+
+    while not BufferScroll.database_loaded:
+        time.sleep(0.001)
+        sublime.run_timeouts()
+
+    return window, BufferScroll.BufferScrollAPI
+
+def stop():
+    measure('plugin_unloaded', BufferScroll.plugin_unloaded)
+
+def open_file(listener, window, file_name, size = 100000, group = None):
+    view = window.open_file(file_name, size, group)
+    measure('on_load_async', listener.on_load_async, view)
+    sublime.run_timeouts()
+    return view
+
+def clone(listener, window, view, group = None):
+    clone = window.clone(view, group)
+    measure('on_clone_async', listener.on_clone_async, clone)
+    sublime.run_timeouts(100)
+    return clone
+
+def switch(listener, window, view):
+    previous = window.active_view()
+
+    if previous is not None:
+        measure('on_deactivated_async', listener.on_deactivated_async, previous)
+
+    window.focus_view(view)
+    measure('on_activated_async', listener.on_activated_async, view)
+    sublime.run_timeouts(100)
+
+def scenario_tabs(tabs = 500, switches = 3000):
+    """
+        Opens many tabs, then switches quickly between them, moving the cursor in some.
+    """
+    window, listener = start({})
+    chance = random.Random(0)
+
+    views = [open_file(listener, window, '/project/file%d.txt' % i) for i in range(tabs)]
+
+    for i in range(switches):
+        view = chance.choice(views)
+        switch(listener, window, view)
+
+        if chance.random() < 0.2:
+            view.sel().clear()
+            view.sel().add(sublime.Region(chance.randrange(view.size())))
+            measure('on_selection_modified_async', listener.on_selection_modified_async, view)
+
+    measure('flush', BufferScroll.save_thread.flush)
+    stop()
+    report('%d tabs, %d switches' % (tabs, switches))
+
+def scenario_project(tabs = 300, folds = 50):
+    """
+        Reopens a project with many tabs having saved folds and selections, only the active tab
+        being visible, then lets the background tabs restore while idle.
+    """
+    window, listener = start({})
+    names = ['/project/session%d.txt' % i for i in range(tabs)]
+
+    for name in names:
+        view = window.open_file(name, folds * 1000)
+        view.fold([sublime.Region(i * 1000 + 100, i * 1000 + 900) for i in range(folds)])
+        view.sel().clear()
+        view.sel().add(sublime.Region(folds * 500))
+        listener.save(view, 'on_pre_close')
+
+    window = sublime.Window()
+    views = [window.open_file(name, folds * 1000) for name in names]
+    window.focus_view(views[0])
+
+    start_time = time.perf_counter()
+
+    for view in views:
+        measure('on_load_async', listener.on_load_async, view)
+
+    timings['time to interactive'] = [time.perf_counter() - start_time]
+
+    while measure('idle timeout', sublime.run_timeouts, 1):
+        pass
+
+    restored = len([view for view in views if view.folded_regions()])
+    print('restored %d of %d tabs' % (restored, tabs))
+
+    stop()
+    report('%d tabs reopened with %d folds each' % (tabs, folds))
+
+def scenario_clones(clones = 20, ticks = 500):
+    """
+        Scrolls and folds a view with many clones, with all the synching enabled.
+    """
+    window, listener = start({'synch_scroll': True, 'synch_folds': True, 'synch_bookmarks': True,
+            'synch_marks': True})
+    window.set_layout_groups(4)
+
+    view = open_file(listener, window, '/project/cloned.txt', 1000000)
+    views = [view] + [clone(listener, window, view, i % 4) for i in range(clones - 1)]
+    switch(listener, window, view)
+
+    for i in range(ticks):
+        view.set_viewport_position((0, i * sublime.LINE_HEIGHT))
+        measure('synch_scroll', listener.synch_scroll)
+
+    # smooth scrolling, a quarter of line at a time
+    for i in range(ticks):
+        view.set_viewport_position((0, i * sublime.LINE_HEIGHT / 4))
+        measure('synch_scroll smooth', listener.synch_scroll)
+
+    for i in range(ticks):
+        view.fold(sublime.Region(i * 800, i * 800 + 400))
+        measure('on_post_text_command fold', listener.on_post_text_command, view, 'fold', None)
+
+    for i in range(ticks // 5):
+        view.add_regions('bookmarks', view.get_regions('bookmarks') + [sublime.Region(i * 1600)])
+        measure('on_post_text_command bookmark', listener.on_post_text_command, view, 'toggle_bookmark', None)
+
+    for other in views[1:50]:
+        switch(listener, window, other)
+
+    stop()
+    report('%d clones, %d scroll and fold ticks' % (clones, ticks))
+
+def scenario_synch_folds(folds = 5000, clones = 3, toggles = 200):
+    """
+        Synchs the folds and bookmarks of a view having thousands of them with its clones, one
+        fold or bookmark toggled at a time.
+    """
+    window, listener = start({'synch_folds': True, 'synch_bookmarks': True})
+    window.set_layout_groups(clones + 1)
+
+    view = open_file(listener, window, '/project/outline.txt', folds * 1000)
+    views = [view] + [clone(listener, window, view, i + 1) for i in range(clones)]
+    switch(listener, window, view)
+
+    view.fold([sublime.Region(i * 1000 + 100, i * 1000 + 900) for i in range(folds)])
+    view.add_regions('bookmarks', [sublime.Region(i * 1000) for i in range(folds)])
+    measure('synch_data all', listener.synch_data, view, 'fold_all', ('folds', 'bookmarks'))
+
+    for other in views:
+        other.fold_changes = 0
+
+    for i in range(toggles):
+        region = sublime.Region(i * 25000 + 100, i * 25000 + 900)
+
+        if not view.unfold(region):
+            view.fold(region)
+
+        measure('synch_data fold', listener.synch_data, view, 'fold', ('folds',))
+
+        bookmarks = view.get_regions('bookmarks')
+        view.add_regions('bookmarks', bookmarks[:i] + bookmarks[i + 1:])
+        measure('synch_data bookmark', listener.synch_data, view, 'toggle_bookmark', ('bookmarks',))
+
+        # typing schedules a synch of the folds, which rarely changed
+        measure('synch_data unchanged', listener.synch_data, view, 'on_modified', ('folds', 'bookmarks'))
+
+    stop()
+    report('%d folds and bookmarks, %d clones, %d toggles, %d regions folded or unfolded on the clones' % (
+            folds, clones, toggles, sum(other.fold_changes for other in views[1:])))
+
+def scenario_folds(folds = 10000, repeat = 20):
+    """
+        Saves and restores a file with many folds, and selects its folded and unfolded regions.
+    """
+    window, listener = start({})
+
+    view = open_file(listener, window, '/project/folded.txt', folds * 1000)
+    view.fold([sublime.Region(i * 1000 + 100, i * 1000 + 900) for i in range(folds)])
+
+    for i in range(repeat):
+        view.insert(0, '')
+        measure('save', listener.save, view, 'on_pre_close')
+        measure('save unchanged', listener.save, view, 'on_deactivated')
+
+    measure('flush', BufferScroll.save_thread.flush)
+
+    for i in range(repeat):
+        other = open_file(listener, window, '/project/folded.txt', folds * 1000)
+        window.close(other)
+        listener.on_close(other)
+
+    window.focus_view(view)
+
+    for i in range(repeat):
+        measure('fold_select_folded', BufferScroll.BufferScrollFoldSelectFolded(window).run)
+        measure('fold_select_unfolded', BufferScroll.BufferScrollFoldSelectUnfolded(window).run)
+
+    stop()
+    report('%d folds' % folds)
+
+def scenario_typewriter(keystrokes = 3000, per_frame = 4):
+    """
+        Types in bursts of `per_frame` keystrokes between two frames, as a fast typist, a held
+        key or a macro would, with typewriter scrolling disabled and enabled. The `keystroke`
+        row is the time from the edit to the end of the frame rendering it, per keystroke.
+    """
+
+    for enabled in (False, True):
+        window, listener = start({'typewriter_scrolling': enabled})
+        view = open_file(listener, window, '/project/typed.txt', 1000000)
+        switch(listener, window, view)
+
+        for i in range(keystrokes // per_frame):
+            start_time = time.perf_counter()
+
+            for j in range(per_frame):
+                point = view.sel()[0].b + 1
+                view.insert(point, 'x')
+                view.sel().clear()
+                view.sel().add(sublime.Region(point))
+
+                measure('on_modified', listener.on_modified, view)
+                measure('on_modified_async', listener.on_modified_async, view)
+
+            measure('frame', sublime.run_timeouts)
+            timings.setdefault('keystroke', []).append((time.perf_counter() - start_time) / per_frame)
+
+        stop()
+        report('%d keystrokes, %d per frame, typewriter scrolling %s' % (keystrokes, per_frame,
+                'enabled' if enabled else 'disabled'))
+
+def main(names):
+    scenarios = [name[len('scenario_'):] for name in sorted(globals()) if name.startswith('scenario_')]
+
+    for name in names or scenarios:
+
+        if name not in scenarios:
+            print('Unknown scenario %s, use one of: %s' % (name, ', '.join(scenarios)))
+            return 1
+
+        globals()['scenario_' + name]()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
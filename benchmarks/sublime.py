@@ -0,0 +1,489 @@
+"""
+    A stand-in for the `sublime` module, to run the package outside of the application.
+
+    Only what the package uses is here. A buffer is a text with lines of `LINE_LENGTH`
+    characters, including the new line, and every line is `LINE_HEIGHT` pixels high, so the
+    layout and viewport methods return consistent values without any text.
+"""
+
+import bisect
+import itertools
+import tempfile
+import os
+
+HIDDEN = 128
+PERSISTENT = 16
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+
+HOVER_TEXT = 1
+HOVER_GUTTER = 2
+HOVER_MARGIN = 3
+
+LINE_LENGTH = 80
+LINE_HEIGHT = 20.0
+VIEWPORT_WIDTH = 1200.0
+VIEWPORT_HEIGHT = 800.0
+
+_ids = itertools.count(1)
+_windows = []
+_settings = {}
+_timeouts = []
+_data = tempfile.mkdtemp(prefix = 'BufferScroll')
+
+os.makedirs(os.path.join(_data, 'Packages'))
+
+
+def packages_path():
+    return os.path.join(_data, 'Packages')
+
+def load_settings(name):
+
+    if name not in _settings:
+        _settings[name] = Settings()
+
+    return _settings[name]
+
+def set_timeout(callback, delay = 0):
+    _timeouts.append(callback)
+
+def set_timeout_async(callback, delay = 0):
+    _timeouts.append(callback)
+
+def run_timeouts(limit = 10000):
+    """
+        Runs the scheduled callbacks, including the ones they schedule, at most `limit` of them.
+        The delays are ignored. Returns how many ran.
+    """
+    count = 0
+
+    while _timeouts and count < limit:
+        _timeouts.pop(0)()
+        count += 1
+
+    return count
+
+def status_message(message):
+    pass
+
+def message_dialog(message):
+    print(message)
+
+def windows():
+    return list(_windows)
+
+def active_window():
+
+    if not _windows:
+        Window()
+
+    return _windows[0]
+
+def reset():
+    """
+        Closes all windows, and forgets all settings and callbacks.
+    """
+    del _windows[:]
+    del _timeouts[:]
+    _settings.clear()
+
+
+class Region(object):
+    __slots__ = ('a', 'b', 'xpos')
+
+    def __init__(self, a, b = None, xpos = -1):
+
+        if b is None:
+            b = a
+
+        self.a = a
+        self.b = b
+        self.xpos = xpos
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.a, self.b))
+
+    def __lt__(self, other):
+        return self.begin() < other.begin()
+
+    def __len__(self):
+        return self.size()
+
+    def __repr__(self):
+        return '(' + str(self.a) + ', ' + str(self.b) + ')'
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.a - self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+    def contains(self, point):
+
+        if isinstance(point, Region):
+            return self.begin() <= point.begin() and point.end() <= self.end()
+
+        return self.begin() <= point <= self.end()
+
+    def intersects(self, other):
+        return self.begin() < other.end() and other.begin() < self.end() \
+                or self.empty() and other.contains(self.a) \
+                or other.empty() and self.contains(other.a)
+
+
+class Settings(object):
+
+    def __init__(self, values = None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+
+    def get(self, key, default = None):
+        return self.values.get(key, default)
+
+    def has(self, key):
+        return key in self.values
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def update(self, values):
+        self.values.update(values)
+
+        for callback in list(self.callbacks.values()):
+            callback()
+
+    def add_on_change(self, tag, callback):
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+
+class Selection(object):
+
+    def __init__(self):
+        self.regions = [Region(0)]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __iter__(self):
+        return iter(list(self.regions))
+
+    def __getitem__(self, index):
+        return self.regions[index]
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, region):
+
+        if not isinstance(region, Region):
+            region = Region(region)
+
+        bisect.insort(self.regions, region)
+
+    def add_all(self, regions):
+
+        for region in regions:
+            self.add(region)
+
+    def subtract(self, region):
+        self.regions = [item for item in self.regions if item != region]
+
+
+class Buffer(object):
+
+    def __init__(self, file_name, size):
+        self.id = next(_ids)
+        self.file_name = file_name
+        self.size = size
+        self.change_count = 0
+
+
+class View(object):
+
+    def __init__(self, window, buffer):
+        self.view_id = next(_ids)
+        self.buffer = buffer
+        self.parent = window
+        self.view_settings = Settings()
+        self.selection = Selection()
+        self.regions = {}
+        self.folds = []
+        self.fold_changes = 0 # not in the API, how many regions were folded or unfolded
+        self.position = (0.0, 0.0)
+        self.loading = False
+
+    def __eq__(self, other):
+        return isinstance(other, View) and self.view_id == other.view_id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self.view_id
+
+    def id(self):
+        return self.view_id
+
+    def buffer_id(self):
+        return self.buffer.id
+
+    def is_valid(self):
+        return self.parent is not None
+
+    def window(self):
+        return self.parent
+
+    def file_name(self):
+        return self.buffer.file_name
+
+    def name(self):
+        return ''
+
+    def size(self):
+        return self.buffer.size
+
+    def change_count(self):
+        return self.buffer.change_count
+
+    def is_loading(self):
+        return self.loading
+
+    def is_scratch(self):
+        return False
+
+    def settings(self):
+        return self.view_settings
+
+    def sel(self):
+        return self.selection
+
+    def substr(self, point):
+
+        if isinstance(point, Region):
+            return ''.join(self.substr(item) for item in range(point.begin(), point.end()))
+
+        return '\n' if point % LINE_LENGTH == LINE_LENGTH - 1 else 'x'
+
+    def insert(self, point, text):
+        """
+            Not in the API, grows the buffer as an edit would.
+        """
+        self.buffer.size += len(text)
+        self.buffer.change_count += 1
+
+    def rowcol(self, point):
+        return (point // LINE_LENGTH, point % LINE_LENGTH)
+
+    def text_point(self, row, col):
+        return min(self.buffer.size, row * LINE_LENGTH + col)
+
+    def line(self, point):
+
+        if isinstance(point, Region):
+            return Region(self.line(point.begin()).begin(), self.line(point.end()).end())
+
+        start = point // LINE_LENGTH * LINE_LENGTH
+        return Region(start, min(self.buffer.size, start + LINE_LENGTH - 1))
+
+    def lines(self, region):
+        return [self.line(point) for point in range(self.line(region.begin()).a, region.end() + 1, LINE_LENGTH)]
+
+    def get_regions(self, key):
+        return list(self.regions.get(key, []))
+
+    def add_regions(self, key, regions, scope = '', icon = '', flags = 0):
+        self.regions[key] = list(regions)
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def folded_regions(self):
+        return list(self.folds)
+
+    def fold(self, regions):
+
+        if isinstance(regions, Region):
+            regions = [regions]
+
+        folds = set(self.folds)
+        new = [region for region in regions if region not in folds]
+
+        self.folds = sorted(folds.union(new), key = Region.begin)
+        self.fold_changes += len(new)
+        return bool(new)
+
+    def unfold(self, regions):
+
+        if isinstance(regions, Region):
+            regions = [regions]
+
+        begins = [fold.begin() for fold in self.folds]
+        unfolded_set = set()
+
+        for region in regions:
+
+            for fold in self.folds[max(0, bisect.bisect_left(begins, region.begin()) - 1):]:
+
+                if fold.begin() > region.end():
+                    break
+
+                if region.intersects(fold) or region.contains(fold):
+                    unfolded_set.add(fold)
+
+        unfolded = [fold for fold in self.folds if fold in unfolded_set]
+
+        self.folds = [fold for fold in self.folds if fold not in unfolded_set]
+        self.fold_changes += len(unfolded)
+        return unfolded
+
+    def line_height(self):
+        return LINE_HEIGHT
+
+    def viewport_position(self):
+        return self.position
+
+    def set_viewport_position(self, position, animate = True):
+        self.position = (float(position[0]), max(0.0, float(position[1])))
+
+    def viewport_extent(self):
+        return (VIEWPORT_WIDTH, VIEWPORT_HEIGHT)
+
+    def layout_extent(self):
+        return (VIEWPORT_WIDTH, (self.buffer.size // LINE_LENGTH + 1) * LINE_HEIGHT)
+
+    def text_to_layout(self, point):
+        return (point % LINE_LENGTH * 8.0, point // LINE_LENGTH * LINE_HEIGHT)
+
+    def layout_to_text(self, vector):
+        return self.text_point(int(vector[1] // LINE_HEIGHT), int(vector[0] // 8))
+
+    def visible_region(self):
+        top = int(self.position[1] // LINE_HEIGHT)
+        bottom = top + int(VIEWPORT_HEIGHT // LINE_HEIGHT)
+        return Region(min(self.buffer.size, top * LINE_LENGTH), min(self.buffer.size, bottom * LINE_LENGTH))
+
+    def show_at_center(self, point):
+        top = point // LINE_LENGTH * LINE_HEIGHT - VIEWPORT_HEIGHT / 2
+        self.set_viewport_position((self.position[0], top))
+
+    def show(self, point, show_surrounds = True):
+
+        if not self.visible_region().contains(point):
+            self.show_at_center(point)
+
+    def run_command(self, command, args = None):
+        pass
+
+
+class Window(object):
+
+    def __init__(self):
+        self.window_id = next(_ids)
+        self.groups = [[]]
+        self.active = [None]
+        self.group = 0
+
+        _windows.append(self)
+
+    def id(self):
+        return self.window_id
+
+    def views(self):
+        return [view for group in self.groups for view in group]
+
+    def num_groups(self):
+        return len(self.groups)
+
+    def active_group(self):
+        return self.group
+
+    def views_in_group(self, group):
+        return list(self.groups[group])
+
+    def active_view_in_group(self, group):
+        return self.active[group]
+
+    def active_view(self):
+        return self.active[self.group]
+
+    def get_view_index(self, view):
+
+        for group, views in enumerate(self.groups):
+
+            if view in views:
+                return (group, views.index(view))
+
+        return (-1, -1)
+
+    def set_layout_groups(self, count):
+        """
+            Not in the API, a layout with that many groups.
+        """
+
+        while len(self.groups) < count:
+            self.groups.append([])
+            self.active.append(None)
+
+    def open_file(self, file_name, size = 100000, group = None):
+        """
+            Like `open_file`, without sending any event.
+        """
+        return self.add_view(View(self, Buffer(file_name, size)), group)
+
+    def clone(self, view, group = None):
+        """
+            Like the `clone_file` command, without sending any event.
+        """
+        return self.add_view(View(self, view.buffer), group)
+
+    def add_view(self, view, group = None):
+
+        if group is None:
+            group = self.group
+
+        self.groups[group].append(view)
+        self.active[group] = view
+        self.group = group
+        return view
+
+    def focus_view(self, view):
+        group, index = self.get_view_index(view)
+
+        if group != -1:
+            self.group = group
+            self.active[group] = view
+
+    def close(self, view):
+        group, index = self.get_view_index(view)
+
+        if group != -1:
+            del self.groups[group][index]
+
+            if self.active[group] == view:
+                self.active[group] = self.groups[group][-1] if self.groups[group] else None
+
+        view.parent = None
+
+    def run_command(self, command, args = None):
+        pass
@@ -0,0 +1,23 @@
+"""
+    A stand-in for the `sublime_plugin` module, see `sublime.py`.
+"""
+
+
+class EventListener(object):
+    pass
+
+
+class ApplicationCommand(object):
+    pass
+
+
+class WindowCommand(object):
+
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand(object):
+
+    def __init__(self, view):
+        self.view = view